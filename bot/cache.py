@@ -0,0 +1,70 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Hashable, Optional, Callable, Iterable
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    In-process LRU cache with optional time-to-live.
+    Expired entries are kept until evicted, so callers may still fall back to them with `allow_stale`.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and monotonic() - stored_at > self.ttl
+
+    def get(self, key: Hashable, default: Any = None, allow_stale: bool = False) -> Any:
+        entry = self._data.get(key, None)
+        if entry is None or (not allow_stale and self._expired(entry[1])):
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """ Returns entry even if expired, without touching LRU order and hit counters """
+        entry = self._data.get(key, None)
+        return entry[0] if entry is not None else default
+
+    def set(self, key: Hashable, value: Any):
+        self._data[key] = (value, monotonic())
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return entry[0] if entry is not None else default
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """ Drops every entry with key matching predicate, returns amount of dropped entries """
+        keys = [key for key in self._data.keys() if predicate(key)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def keys(self) -> Iterable[Hashable]:
+        return list(self._data.keys())
+
+    def clear(self):
+        self._data.clear()
+
+    def describe(self) -> str:
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0
+        return f"{len(self._data)}/{self.max_size} entries, {self.hits} hits, {self.misses} misses ({ratio:.0f}% hit)"
@@ -0,0 +1,117 @@
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from .payloads import ChatPayload
+
+# rough length of relayed line besides message text itself: timestamp, steam id, name
+MESSAGE_OVERHEAD: int = 60
+
+
+class ChatQueue:
+    """
+    Bounded buffer of in-game chat messages for a single custom game.
+    Once full, oldest messages are dropped; with `summarize_overflow`, amount of dropped ones is reported on flush.
+    Messages that failed to be relayed `max_attempts` times are dropped, so a failing batch can't block the relay.
+    Messages may be pushed with completion future, resolved with True once message is relayed (or deliberately
+    dropped on overflow), or with False once it's dropped after failed relays.
+    """
+
+    def __init__(self, name: str, max_size: int = 200, flush_length: int = 1800, summarize_overflow: bool = True,
+                 max_attempts: int = 3):
+        self.name = name
+        self.max_size = max_size
+        self.flush_length = flush_length
+        self.summarize_overflow = summarize_overflow
+        self.max_attempts = max_attempts
+
+        self.messages: Deque[ChatPayload] = deque()
+        self.buffered_length = 0
+        self.dropped = 0
+        self.failed = 0
+        # failed relay attempts of queued messages, by message id()
+        self.attempts: Dict[int, int] = {}
+        self._drained_attempts: Dict[int, int] = {}
+        # completion futures of queued and draining messages, by message id()
+        self._completions: Dict[int, asyncio.Future] = {}
+        self.flush_scheduled = False
+        self._lock: Optional[asyncio.Lock] = None
+
+    def __len__(self):
+        return len(self.messages)
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @staticmethod
+    def _length(message: ChatPayload) -> int:
+        return len(message.text) + MESSAGE_OVERHEAD
+
+    def complete(self, messages: List[ChatPayload], relayed: bool = True):
+        """ Resolves completion futures of messages leaving the queue """
+        for message in messages:
+            completion = self._completions.pop(id(message), None)
+            if completion and not completion.done():
+                completion.set_result(relayed)
+
+    def push(self, message: ChatPayload, completion: Optional[asyncio.Future] = None) -> bool:
+        """ Adds message to the queue. Returns True if buffered text is enough to fill one Discord message """
+        if len(self.messages) >= self.max_size:
+            dropped_message = self.messages.popleft()
+            self.buffered_length -= self._length(dropped_message)
+            self.dropped += 1
+            self.complete([dropped_message])
+            if self.dropped == 1:
+                logger.warning(f"[{self.name}] Chat queue is full, dropping oldest messages")
+        if completion:
+            self._completions[id(message)] = completion
+        self.messages.append(message)
+        self.buffered_length += self._length(message)
+        return self.buffered_length >= self.flush_length
+
+    def drain(self) -> Tuple[List[ChatPayload], int]:
+        """ Takes all queued messages, together with amount of messages dropped since last drain """
+        messages, dropped = list(self.messages), self.dropped
+        self._drained_attempts, self.attempts = self.attempts, {}
+        self.messages.clear()
+        self.buffered_length = 0
+        self.dropped = 0
+        return messages, dropped
+
+    def restore(self, messages: List[ChatPayload], dropped: int = 0):
+        """
+        Puts back messages that failed to be relayed, in front of ones queued since drain.
+        Messages that failed max_attempts times already are dropped instead.
+        """
+        self.dropped += dropped
+        failed = 0
+        for message in reversed(messages):
+            attempts = self._drained_attempts.get(id(message), 0) + 1
+            if attempts >= self.max_attempts:
+                failed += 1
+                self.complete([message], relayed=False)
+                continue
+            if len(self.messages) >= self.max_size:
+                self.dropped += 1
+                self.complete([message])
+                continue
+            self.messages.appendleft(message)
+            self.attempts[id(message)] = attempts
+            self.buffered_length += self._length(message)
+        self._drained_attempts = {}
+        if failed:
+            self.failed += failed
+            logger.warning(f"[{self.name}] Dropped {failed} chat messages after {self.max_attempts} failed relays")
+
+    def overflow_notice(self, dropped: int) -> Optional[str]:
+        if not dropped:
+            return None
+        logger.warning(f"[{self.name}] Dropped {dropped} chat messages on overflow")
+        if not self.summarize_overflow:
+            return None
+        return f"*... {dropped} older message{'s' if dropped != 1 else ''} skipped due to chat flood*"
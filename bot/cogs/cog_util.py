@@ -1,17 +1,26 @@
+import asyncio
 import io
 from asyncio import TimeoutError
-from typing import Final, Union
+from concurrent.futures.process import BrokenProcessPool
+from typing import Final, List, Optional, Union
 from uuid import uuid1
 
-from PIL import Image
-from aiohttp import ClientSession
-from discord import Embed, Message, File
+from PIL.Image import DecompressionBombError
+from aiohttp import ClientError, ClientSession
+from discord import Attachment, Embed, Message, File
 from discord.ext.commands import Context
 from loguru import logger
 
-from .embeds import get_issue_embed
+from .embeds import get_issue_embed, embed_fingerprint
+from ..cache import TTLCache
+from ..image_processing import COMPRESSION_THRESHOLD, DownloadTooLarge, UnsupportedContentType
+from ..image_processing import compress_image_async, download_limited, is_image
 
 PAGE_CONTROLS: Final = {"⏮": -1, "⏭": 1}
+ATTACHMENT_CONCURRENCY: Final = 4
+
+# fingerprints of embeds and views shown in issue messages by message id, to skip edits changing nothing
+shown_embeds = TTLCache(max_size=2048, ttl=24 * 60 * 60)
 
 
 async def get_argument(context: Context, text: str) -> str:
@@ -42,50 +51,90 @@ async def process_attachments(context, attachment_url: str):
     return await process_attachments_contextless(context.message, context.bot.session, attachment_url)
 
 
-async def process_attachments_contextless(message, session, attachment_url: str, delete_original: bool = True) -> str:
+def _file_link(attachment_url: str) -> str:
+    return f"\n[{attachment_url.split('?')[0].split('/')[-1]}]({attachment_url})"
+
+
+async def process_attachments_contextless(message, session, attachment_url: str, delete_original: bool = True,
+                                          content_type: Optional[str] = None) -> str:
+    """ Returns markdown of attachment, compressing too large images. Anything but images is linked as is """
+    if content_type is not None and not is_image(content_type):
+        return _file_link(attachment_url)
     logger.info(f"[Image processing] initial image url: {attachment_url}")
     if delete_original:
         prev_text = f"From {message.author.mention}\n```{message.content}```"
     else:
         prev_text = ""
 
-    resp = await session.get(attachment_url)
-
-    content_length = int(resp.headers['Content-Length'])
-    logger.info(f"[Image processing] received content length: {content_length}")
-    result = io.BytesIO()
-    if content_length >= 6e+6:
-        warn_msg = await message.reply(
-            f"Attached image size exceeded 10mb. Compressing image, issue will be opened afterwards."
-        )
-        logger.info("[Image processing] compressing image")
-        data = io.BytesIO(await resp.read())
-        img = Image.open(data)
-
-        # resize for very large images
-        if img.width > 1600:
-            logger.info(f"Image width exceeded 1600, resizing")
-            img = img.resize((img.width // 2, img.height // 2))
-        img.save(result, optimize=True, quality=50, format='PNG')
-        logger.info(f"new size: {result.tell()}")
-        result.seek(0)
+    try:
+        data = await download_limited(session, attachment_url, images_only=True)
+    except UnsupportedContentType:
+        return _file_link(attachment_url)
+    except (DownloadTooLarge, ClientError, TimeoutError) as error:
+        logger.warning(f"[Image processing] not processing {attachment_url}: {error!r}")
+        return f"\n![image]({attachment_url})"
+    logger.info(f"[Image processing] received size: {len(data)}")
+    if len(data) < COMPRESSION_THRESHOLD:
+        return f"\n![image]({attachment_url})"
+
+    warn_msg = await message.reply(
+        f"Attached image is too large. Compressing image, issue will be opened afterwards."
+    )
+    logger.info("[Image processing] compressing image")
+    try:
+        try:
+            compressed = await compress_image_async(data)
+        except (OSError, DecompressionBombError, BrokenProcessPool) as error:
+            # OSError includes UnidentifiedImageError of images Pillow can't read
+            logger.warning(f"[Image processing] couldn't compress {attachment_url}: {error!r}")
+            return f"\n![image]({attachment_url})"
+        logger.info(f"new size: {len(compressed.data)} ({compressed.extension})")
         compressed_message = await message.reply(
             f"{prev_text}With compressed image",
-            file=File(result, filename=f"resized_image_{uuid1().int}.png")
+            file=File(io.BytesIO(compressed.data), filename=f"resized_image_{uuid1().int}.{compressed.extension}")
         )
-        attachment_url = compressed_message.attachments[0].url
-        logger.info(f"new image url: {attachment_url}")
+    finally:
         await warn_msg.delete()
-        if delete_original:
-            await message.delete()
+    attachment_url = compressed_message.attachments[0].url
+    logger.info(f"new image url: {attachment_url}")
+    if delete_original:
+        await message.delete()
 
     return f"\n![image]({attachment_url})"
 
 
+async def process_all_attachments(message, session, attachments: List[Attachment]) -> str:
+    """
+    Processes every attachment of the message concurrently (up to ATTACHMENT_CONCURRENCY at once),
+    returning their markdown in original order. Original message is kept.
+    """
+    semaphore = asyncio.Semaphore(ATTACHMENT_CONCURRENCY)
+
+    async def _process(attachment: Attachment) -> str:
+        async with semaphore:
+            return await process_attachments_contextless(
+                message, session, attachment.url, False, attachment.content_type
+            )
+
+    return "".join(await asyncio.gather(*[_process(attachment) for attachment in attachments]))
+
+
 async def update_issue_embed(
         session: ClientSession, message: Message, detail: dict, repo: str, issue_number: Union[str, int]
 ) -> Message:
     new_embed = await get_issue_embed(session, detail, issue_number, repo)
-    return await message.edit(
-        content=message.content, embed=new_embed
-    )
+    return await edit_issue_message(message, new_embed)
+
+
+async def edit_issue_message(message: Message, embed: Embed, **kwargs) -> Message:
+    """
+    Edits message with new embed and view, unless the same ones are already shown there.
+    Edits with any other arguments always go through.
+    """
+    view = kwargs.get("view")
+    fingerprint = embed_fingerprint(embed, view.to_components() if view else None)
+    if kwargs.keys() <= {"view"} and shown_embeds.get(message.id) == fingerprint:
+        return message
+    message = await message.edit(content=message.content, embed=embed, **kwargs)
+    shown_embeds.set(message.id, fingerprint)
+    return message
@@ -47,8 +47,8 @@ class Core(commands.Cog, name="Core"):
         for custom_game, m_channel in self.bot.chat_channels.items():
             if not m_channel or context.channel.id != m_channel.id:
                 continue
-            target_link = SERVER_LINKS.get(custom_game, None)
-            if not target_link:
+            backend = self.bot.game_backends.get(custom_game)
+            if not backend:
                 return
 
             if duration:
@@ -65,15 +65,12 @@ class Core(commands.Cog, name="Core"):
             else:
                 delta = timedelta(days=7)
 
-            resp = await self.bot.session.post(
-                f"{target_link}/api/lua/match/mute_player_in_chat",
-                json={
-                    "steamId": str(target_steam_id + 76561197960265728),
-                    "until": str(datetime.utcnow() + delta),
-                    "customGame": custom_game,
-                }
-            )
-            await context.message.add_reaction("✅" if resp.status < 400 else "🚫")
+            response = await backend.post("/api/lua/match/mute_player_in_chat", {
+                "steamId": str(target_steam_id + 76561197960265728),
+                "until": str(datetime.utcnow() + delta),
+                "customGame": custom_game,
+            })
+            await context.message.add_reaction("✅" if response.ok else "🚫")
 
     @commands.command()
     async def unmute(self, context: Context, target_steam_id: int):
@@ -81,17 +78,14 @@ class Core(commands.Cog, name="Core"):
         for custom_game, m_channel in self.bot.chat_channels.items():
             if not m_channel or context.channel.id != m_channel.id:
                 continue
-            target_link = SERVER_LINKS.get(custom_game, None)
-            if not target_link:
+            backend = self.bot.game_backends.get(custom_game)
+            if not backend:
                 return
 
-            resp = await self.bot.session.post(
-                f"{target_link}/api/lua/match/unmute_player_in_chat",
-                json={
-                    "steamId": str(target_steam_id + 76561197960265728)
-                }
-            )
-            await context.message.add_reaction("✅" if resp.status < 400 else "🚫")
+            response = await backend.post("/api/lua/match/unmute_player_in_chat", {
+                "steamId": str(target_steam_id + 76561197960265728)
+            })
+            await context.message.add_reaction("✅" if response.ok else "🚫")
 
     @commands.command()
     async def season_reset(self, context: Context):
@@ -1,33 +1,23 @@
-import re
+import hashlib
+import json
+from copy import deepcopy
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from urllib.parse import quote
 
 from aiohttp import ClientSession
 from discord import Embed
 from discord.colour import Colour
 
-from ..github_integration import get_issue_by_number, get_pull_request_by_number
+from ..cache import TTLCache
+from ..markdown import extract_image_link, render_markdown
 
-url_regex = re.compile(
-    "(https?:\/\/(.+?\.)?github\.com\/arcadia-redux\/.*\/(issues|pull)\/\d*)"
-)
+# issue can't look different without its updated_at changing, apart from states of referenced issues
+issue_embed_cache = TTLCache(max_size=512, ttl=10 * 60)
 
 
 def get_image_link(body: str) -> (str, str):
-    result = re.search(
-        r"(!\[(.*?)\]\((.*?)\))",
-        body
-    )
-    if result:
-        link_structure = result.group(0)
-        primary_link_start = link_structure.find("(")
-        extracted_link = link_structure[primary_link_start + 1: -1]
-        cleaned_body = body \
-            .replace(link_structure, "[On Thumbnail]") \
-            .replace(link_structure, "[On Thumbnail]")
-        return extracted_link, cleaned_body
-    return "", body
+    return extract_image_link(body)
 
 
 def get_users_parsed(assignees: List[dict]) -> str:
@@ -47,51 +37,35 @@ def get_labels_parsed(repo_name: str, labels: List[dict]) -> str:
 
 
 async def parse_markdown(session: ClientSession, text: str, repo_name: str) -> str:
-    issue_number_refs = re.findall(
-        r"( #[0-9]*)",  # searching for #111 issue numbers, for task lists
-        text
-    )
-    github_obj_links = re.findall(url_regex, text)
-    for issue_number in issue_number_refs:
-        status, issue_data = await get_issue_by_number(session, repo_name, issue_number.replace(" #", ""))
-        if status:
-            issue_state = "🟢" if issue_data['state'] == "open" else "🔴"
-            text = text.replace(
-                issue_number, f" {issue_state} [{issue_number} {issue_data['title']}]({issue_data['html_url']})"
-            )
-    for github_obj in github_obj_links:
-        github_obj_link = github_obj[0]
-        link_split = github_obj_link.split("/")
-        m_repo_name, obj_type, obj_id = link_split[-3:]
-        if obj_type == "issues":
-            status, obj_data = await get_issue_by_number(session, m_repo_name, obj_id)
-        else:
-            status, obj_data = await get_pull_request_by_number(session, m_repo_name, obj_id)
-        if status:
-            issue_state = "🟢" if obj_data['state'] == "open" else "🔴"
-            text = text.replace(
-                github_obj_link, f"{issue_state} [#{obj_data['number']} {obj_data['title']}]({github_obj_link})"
-            )
-
-    return text.replace("- [x]", "✅").replace("* [x]", "✅").replace("- [ ]", "☐")
+    return (await render_markdown(session, text, repo_name)).text
+
+
+def embed_fingerprint(embed: Embed, components: Optional[list] = None) -> str:
+    """ Hash of embed, together with message components (of view) shown with it, if given """
+    shown = {"embed": embed.to_dict(), "components": components}
+    return hashlib.sha1(json.dumps(shown, sort_keys=True).encode("utf8")).hexdigest()
 
 
 async def get_issue_embed(session: ClientSession, data: dict, object_id: str, repo_name: str,
                           link: str = None) -> Embed:
     if not link:
         link = data["html_url"]
+    cache_key = (repo_name, str(object_id), data.get("updated_at"), link)
+    if (cached := issue_embed_cache.get(cache_key)) is not None:
+        # embeds are mutable, cache holds their dict form
+        return Embed.from_dict(deepcopy(cached))
+
     labels = get_labels_parsed(repo_name, data['labels'])
     assignees = get_users_parsed(data["assignees"])
     milestone = data.get("milestone", {})
     if milestone:
         milestone = milestone.get("title", None)
-    image_link, data["body"] = get_image_link(data["body"] or "")
-    data["body"] = (await parse_markdown(session, data["body"] or "", repo_name)).strip()
+    body, image_link = await render_markdown(session, data["body"] or "", repo_name, extract_image=True, limit=1800)
     description = [
         f"**Labels**: {labels}\n" if labels else "",
         f"**Assignees**: {assignees}\n" if assignees else "",
         f"**Milestone**: `{milestone}`\n" if milestone else "",
-        f'\n{data["body"]}' if len(data["body"]) < 1800 else "",
+        f'\n{body.strip()}',
     ]
     complete_description = "".join(description)
 
@@ -110,6 +84,8 @@ async def get_issue_embed(session: ClientSession, data: dict, object_id: str, re
                           f"| Opened at {opened_at_date.strftime('%c')}")
     if image_link:
         embed.set_image(url=image_link)
+    if data.get("updated_at"):
+        issue_embed_cache.set(cache_key, deepcopy(embed.to_dict()))
     return embed
 
 
@@ -135,7 +111,7 @@ async def get_pull_request_embed(session: ClientSession, data: dict, object_id:
     elif data['mergeable_state'] == "dirty":
         merge_state = "has conflicts"
         color = Colour.dark_orange()
-    data["body"] = await parse_markdown(session, data["body"] or "", repo_name)
+    body = (await render_markdown(session, data["body"] or "", repo_name, limit=1200)).text
     description = [
         f"**Labels**: {labels}" if labels else "",
         f"**Assignees**: {assignees}" if assignees else "",
@@ -144,7 +120,7 @@ async def get_pull_request_embed(session: ClientSession, data: dict, object_id:
         f"**Changes**: {data['commits']} commit{'s' if data['commits'] != 1 else ''}, "
         f"`+{data['additions']}` : `-{data['deletions']}` in {data['changed_files']} files",
         f"**Merge state**: `{merge_state}`",
-        f'\n{data["body"]}' if len(data["body"]) < 1200 else "",
+        f'\n{body}',
     ]
     embed = Embed(
         title=data['title'],
@@ -164,8 +140,7 @@ async def get_pull_request_embed(session: ClientSession, data: dict, object_id:
 
 async def get_issue_comment_embed(session: ClientSession, data: dict, object_id: str, repo_name: str,
                                   link: str) -> Embed:
-    image_link, new_body = get_image_link(data["body"] or "")
-    new_body = await parse_markdown(session, new_body, repo_name)
+    new_body, image_link = await render_markdown(session, data["body"] or "", repo_name, extract_image=True)
     embed = Embed(
         title=f"{data['user']['login']}:",
         description=new_body,
@@ -1,14 +1,22 @@
+import re
+import sqlite3
+
 from discord import colour, InputTextStyle, Interaction, default_permissions
 from discord.commands import Option
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ui import InputText
 
 from .cog_util import *
 from .embeds import *
-from ..constants import TARGET_GUILD_IDS, DEDICATED_SERVER_KEY, PRESET_REPOSITORIES, PRIVATE_REPOSITORIES, SERVER_LINKS
+from ..constants import TARGET_GUILD_IDS, DEDICATED_SERVER_KEY, PRESET_REPOSITORIES, PRIVATE_REPOSITORIES
+from ..constants import ISSUE_MIRROR_SYNC_MINUTES
+from ..enums import RequestPriority
+from ..game_backends import GameBackend, BackendResponse
+from ..github_graphql import get_issue_details, get_pull_request_details
 from ..github_integration import *
+from ..issue_mirror import issue_mirror
 from ..views.generic import ModalTextInput
-from ..views.github import IssueControls
+from ..views.github import IssueControls, IssueListPagination
 
 
 class Github(commands.Cog, name="Github"):
@@ -70,8 +78,85 @@ class Github(commands.Cog, name="Github"):
         issue_creation_modal.set_callback(_complete_issue_creation)
         await context.send_modal(issue_creation_modal)
 
+    @commands.slash_command(name="search_issues", guild_ids=TARGET_GUILD_IDS)
+    async def search_issues_slash_command(
+            self,
+            context: ApplicationContext,
+            query: Option(str, "Words to look for in titles, descriptions and labels", required=True),
+            repo_name: Option(str, "Repository name", choices=list(PRESET_REPOSITORIES.keys()), required=False),
+    ):
+        """
+        Search issues and pull requests of preset repositories
+        """
+        full_repo_name = PRESET_REPOSITORIES.get(repo_name, None) if repo_name else None
+        try:
+            results = await issue_mirror.search(query, full_repo_name)
+        except (sqlite3.Error, OSError):
+            logger.exception("[Issue mirror] Search failed")
+            await context.respond("Issue search is unavailable right now.", ephemeral=True)
+            return
+        if not results:
+            await context.respond(f"Nothing found for `{query}`.", ephemeral=True)
+            return
+        await context.defer()
+
+        best_match = results[0]
+        repo = best_match["html_url"].split("/")[-3]
+        other_matches = "\n".join(
+            f"{'🟢' if issue['state'] == 'open' else '🔴'} [`{issue['html_url'].split('/')[-3]}#{issue['number']}`]"
+            f"(<{issue['html_url']}>) {issue['title']}"
+            for issue in results[1:]
+        )
+        embed = await get_issue_embed(self.bot.session, best_match, best_match["number"], repo)
+        issue_view = IssueControls(self.bot.session, repo, best_match["number"], best_match)
+        msg = await context.respond(
+            f"Also found:\n{other_matches}" if other_matches else None, embed=embed, view=issue_view
+        )
+        issue_view.assign_message(msg)
+
+    @commands.slash_command(name="issues", guild_ids=TARGET_GUILD_IDS)
+    async def issues_slash_command(
+            self,
+            context: ApplicationContext,
+            repo_name: Option(str, "Repository name", choices=list(PRESET_REPOSITORIES.keys()), required=True),
+            state: Option(str, "Issue state", choices=["open", "closed", "all"], required=False, default="open"),
+    ):
+        """
+        List issues of target repo
+        """
+        full_repo_name = PRESET_REPOSITORIES.get(repo_name, None)
+        if not full_repo_name:
+            await context.respond(f"Unknown repo name. Please use one from slash command choices.", ephemeral=True)
+            return
+
+        await context.defer()
+        issues_view = IssueListPagination(self.bot.session, full_repo_name, state)
+        try:
+            loaded = await issues_view.load_page(0)
+        except GithubRequestError as error:
+            await issues_view.close_pages()
+            await context.respond(f"Github error occurred:\n{error.details}")
+            return
+        if not loaded:
+            await issues_view.close_pages()
+            await context.respond(f"No {state} issues found in {full_repo_name}.")
+            return
+        msg = await context.respond(embed=issues_view.get_embed(), view=issues_view)
+        issues_view.assign_message(msg)
+
+    @tasks.loop(minutes=ISSUE_MIRROR_SYNC_MINUTES)
+    async def sync_issue_mirror(self):
+        # exceptions would stop the loop, keep syncing on next iteration instead
+        try:
+            stored = await issue_mirror.sync(self.bot.session, PRESET_REPOSITORIES.values())
+            logger.info(f"[Issue mirror] Synced {stored} updated issues")
+        except Exception:
+            logger.exception("[Issue mirror] Sync failed")
+
     @commands.Cog.listener()
     async def on_ready(self):
+        if not self.sync_issue_mirror.is_running():
+            self.sync_issue_mirror.start()
         logger.info("[COG] Github is ready!")
 
     @commands.Cog.listener()
@@ -99,24 +184,20 @@ class Github(commands.Cog, name="Github"):
         repo = issue_link_split[-3]
 
         body = message.content
-        message_split = body.split(":")
-        reply_command = message_split[0]
-        args: List[str] = message_split[1].strip().split(" ") if len(message_split) > 1 else []
 
         if "https://steamcommunity.com/profiles/" in replied_message.embeds[0].author.url:
-            if reply_command.lower() == "send":
+            message_split = body.split(":")
+            if message_split[0].lower() == "send":
                 await self._send_feedback_reply(message, replied_message, issue_number, message_split[1:])
             return
 
-        callback = self.reply_processors.get(reply_command.lower(), None)
-
-        if callback:
-            status = await callback(message, repo, issue_number, args)
+        details = None
+        reply_commands = self._parse_reply_commands(body)
+        if reply_commands:
+            status, details = await self._apply_reply_commands(message, repo, issue_number, reply_commands)
         else:
             if message.attachments:
-                body += await process_attachments_contextless(
-                    message, self.bot.session, message.attachments[0].url, False
-                )
+                body += await process_all_attachments(message, self.bot.session, message.attachments)
 
             status, _ = await comment_issue(
                 self.bot.session,
@@ -124,13 +205,73 @@ class Github(commands.Cog, name="Github"):
                 issue_number,
                 comment_wrap_contextless(body, message)
             )
-        if status:
-            issue_req_status, details = await get_issue_by_number(self.bot.session, repo, issue_number)
-            if issue_req_status:
-                await update_issue_embed(self.bot.session, replied_message, details, repo, issue_number)
+        if status and not details:
+            details_status, details = await get_issue_details(self.bot.session, repo, issue_number)
+            if not details_status:
+                details = None
+        if details:
+            await update_issue_embed(self.bot.session, replied_message, details, repo, issue_number)
         await message.add_reaction("✅" if status else "🚫")
 
-    async def _reply_assign(self, message: Message, repo: str, issue_id: str, assignees: List[str]) -> bool:
+    def _parse_reply_commands(self, body: str) -> List[Tuple[str, str]]:
+        """
+        Splits reply into (command, argument) pairs, one command per line.
+        Lines without command continue argument of the previous one (i.e. multiline description).
+        Returns empty list if reply doesn't start with a command.
+        """
+        reply_commands = []
+        for line in body.split("\n"):
+            command, separator, argument = line.partition(":")
+            command = command.strip().lower()
+            if separator and command in self.reply_processors:
+                reply_commands.append((command, argument.strip()))
+            elif reply_commands:
+                previous_command, previous_argument = reply_commands[-1]
+                reply_commands[-1] = (previous_command, f"{previous_argument}\n{line}")
+            else:
+                return []
+        return reply_commands
+
+    async def _apply_reply_commands(self, message: Message, repo: str, issue_id: str,
+                                    reply_commands: List[Tuple[str, str]]) -> Tuple[bool, Optional[dict]]:
+        """
+        Collects issue fields from every reply command, and applies all of them with single update request.
+        Returns whether every command succeeded, and updated issue data if issue was updated.
+        """
+        status = True
+        fields = {}
+        for command, argument in reply_commands:
+            command_fields = await self.reply_processors[command](message, repo, issue_id, argument)
+            if command_fields is None:
+                status = False
+                continue
+            for key, value in command_fields.items():
+                if isinstance(value, list) and key in fields:
+                    fields[key] = list(dict.fromkeys(fields[key] + value))
+                else:
+                    fields[key] = value
+        if not fields:
+            return False, None
+
+        if "assignees" in fields:
+            # update replaces assignees, while replies are meant to add them
+            issue_status, issue = await get_issue_by_number(self.bot.session, repo, issue_id, RequestPriority.HIGH)
+            if issue_status:
+                current_assignees = [assignee["login"] for assignee in issue["assignees"]]
+                fields["assignees"] = list(dict.fromkeys(current_assignees + fields["assignees"]))
+            else:
+                assign_status, _ = await assign_issue(self.bot.session, repo, issue_id, fields.pop("assignees"))
+                status = status and assign_status
+                if not fields:
+                    return status, None
+
+        update_status, details = await update_issue(self.bot.session, repo, issue_id, fields)
+        if not update_status:
+            return False, None
+        return status, details
+
+    async def _reply_assign(self, message: Message, repo: str, issue_id: str, argument: str) -> Optional[dict]:
+        assignees = argument.split()
         for i, assignee in enumerate(assignees):
             if assignee.startswith("<"):
                 assignees[i] = await self.bot.redis.hget(
@@ -143,23 +284,21 @@ class Github(commands.Cog, name="Github"):
                     )
         assignees = list(filter(None, assignees))
         if not assignees:
-            return False
-        status, _ = await assign_issue(self.bot.session, repo, issue_id, assignees)
-        return status
+            return None
+        return {"assignees": assignees}
 
-    async def _reply_close(self, message: Message, repo: str, issue_id: str, reason: List[str]) -> bool:
-        if len(reason) > 0:
-            status, _ = await comment_issue(
-                self.bot.session, repo, issue_id, comment_wrap_contextless(" ".join(reason), message, "Closed")
+    async def _reply_close(self, message: Message, repo: str, issue_id: str, argument: str) -> Optional[dict]:
+        if argument:
+            await comment_issue(
+                self.bot.session, repo, issue_id, comment_wrap_contextless(argument, message, "Closed")
             )
-        status, _ = await set_issue_state(self.bot.session, repo, issue_id)
-        return status
+        return {"state": "closed"}
 
-    async def _reply_label(self, message: Message, repo: str, issue_id: str, labels_base: List[str]) -> bool:
+    async def _reply_label(self, message: Message, repo: str, issue_id: str, argument: str) -> Optional[dict]:
         labels_final = []
         _reading_complex_label = False
         _complex_label = ""
-        for m_label in labels_base:
+        for m_label in argument.split():
             if m_label.startswith('"'):
                 _complex_label = m_label[1:]
                 _reading_complex_label = True
@@ -186,45 +325,38 @@ class Github(commands.Cog, name="Github"):
                     f"\n`{', '.join(labels_missing)}`"
                 )
             if not labels_final:
-                return False
-        status, _ = await add_labels(self.bot.session, repo, issue_id, labels_final)
-        return status
+                return None
+        return {"labels": labels_final}
 
-    async def _reply_milestone(self, message: Message, repo: str, issue_id: str, milestones: List[str]) -> bool:
-        status, _ = await set_issue_milestone(self.bot.session, repo, issue_id, " ".join(milestones).replace('"', ''))
-        return status
+    async def _reply_milestone(self, message: Message, repo: str, issue_id: str, argument: str) -> Optional[dict]:
+        status, milestone_number = await find_milestone_number(self.bot.session, repo, argument.replace('"', ''))
+        if not status:
+            return None
+        return {"milestone": milestone_number}
 
-    async def _reply_title(self, message: Message, repo: str, issue_id: str, new_title: List[str]) -> bool:
-        status, _ = await update_issue(self.bot.session, repo, issue_id, {
-            "title": " ".join(new_title),
-        })
-        return status
+    async def _reply_title(self, message: Message, repo: str, issue_id: str, argument: str) -> Optional[dict]:
+        return {"title": argument}
 
-    async def _reply_description(self, message: Message, repo: str, issue_id: str, new_body: List[str]) -> bool:
-        status, _ = await update_issue(self.bot.session, repo, issue_id, {
-            "body": body_wrap_contextless(" ".join(new_body), message),
-        })
-        return status
+    async def _reply_description(self, message: Message, repo: str, issue_id: str, argument: str) -> Optional[dict]:
+        return {"body": body_wrap_contextless(argument, message)}
 
-    async def __defer_server_link(self, message: Message) -> Optional[str]:
+    async def __defer_backend(self, message: Message) -> Optional[GameBackend]:
         for custom_game, m_channel in self.bot.report_channels.items():
             if not m_channel or message.channel.id != m_channel.id:
                 continue
-            return SERVER_LINKS.get(custom_game, None)
+            return self.bot.game_backends.get(custom_game)
 
-    async def __send_feedback_mail(self, steam_id: str, complete_text_content: str, attachments: dict, server_url: str):
+    @staticmethod
+    async def __send_feedback_mail(steam_id: str, complete_text_content: str, attachments: dict,
+                                   backend: GameBackend) -> BackendResponse:
         mail_data = {
             "steam_id": steam_id,
             "text_content": complete_text_content,
             "attachments": attachments
         }
-        return await self.bot.session.post(
-            f"{server_url}/api/lua/mail/feedback_reply",
-            json=mail_data,
-            headers={
-                "Dedicated-Server-Key": DEDICATED_SERVER_KEY
-            }
-        )
+        return await backend.post("/api/lua/mail/feedback_reply", mail_data, headers={
+            "Dedicated-Server-Key": DEDICATED_SERVER_KEY
+        })
 
     @staticmethod
     async def __add_reply_field(embed: Embed, text_content: str, message: Message, mention: str,
@@ -292,13 +424,13 @@ class Github(commands.Cog, name="Github"):
 
         final_text_content = f"In response to your feedback message:<br> => {feedback_text}" \
                              f"<br><br>{processed_text_content}"
-        server_url = await self.__defer_server_link(replied_message)
-        if not server_url:
+        backend = await self.__defer_backend(replied_message)
+        if not backend:
             await message.add_reaction("🚫")
             return await message.reply(f"Couldn't defer backend URL for this channel.")
-        result = await self.__send_feedback_mail(steam_id, final_text_content, attachments, server_url)
+        result = await self.__send_feedback_mail(steam_id, final_text_content, attachments, backend)
 
-        if result.status < 400:
+        if result.ok:
             await self.__add_reply_field(
                 feedback_embed, processed_text_content, replied_message,
                 message.author.mention, message.jump_url
@@ -320,8 +452,8 @@ class Github(commands.Cog, name="Github"):
         steam_id = embed.author.url.split("/")[-1]
         feedback_text = embed.description.replace("```", "")
 
-        server_url = await self.__defer_server_link(message)
-        if not server_url:
+        backend = await self.__defer_backend(message)
+        if not backend:
             return await context.respond(
                 "Couldn't defer backend server URL for this channel.", ephemeral=True, delete_after=10
             )
@@ -355,11 +487,12 @@ class Github(commands.Cog, name="Github"):
 
             complete_text_content = f"In response to your feedback message:<br> => {feedback_text}" \
                                     f"<br><br>{fields['Text']}"
-            result = await self.__send_feedback_mail(steam_id, complete_text_content, attachments, server_url)
-            if result.status >= 400:
-                logger.info(f"Error sending mail: {result.status}\n{await result.json()}")
+            result = await self.__send_feedback_mail(steam_id, complete_text_content, attachments, backend)
+            if not result.ok:
+                logger.info(f"Error sending mail: {result.status}\n{result.text}")
+                reason = f"Request status code: {result.status}" if result.status else result.text
                 return await modal_context.response.send_message(
-                    f"Failed to send mail.\nRequest status code: {result.status}", ephemeral=True, delete_after=10
+                    f"Failed to send mail.\n{reason}", ephemeral=True, delete_after=10
                 )
             if reward:
                 reward_string = " ".join(reward)
@@ -415,11 +548,13 @@ reward: -10000 currency, -1000 fortune, item_conscription_notification
             extension = ""
         line_pointers = [int(line[1:]) for line in re.findall(self.line_pointer_regex, line_pointers_string)]
 
-        raw_content_response = await self.bot.session.get(raw_link, headers=GITHUB_API_HEADERS)
-        if raw_content_response.status > 200:
-            logger.info(f"{await raw_content_response.text()}")
+        async with self.bot.session.get(raw_link, headers=GITHUB_API_HEADERS) as raw_content_response:
+            raw_content_status = raw_content_response.status
+            raw_content_text = await raw_content_response.text()
+        if raw_content_status > 200:
+            logger.info(f"{raw_content_text}")
             return
-        raw_content = (await raw_content_response.text()).split("\n")
+        raw_content = raw_content_text.split("\n")
         if len(line_pointers) == 1:
             resulting_code = raw_content[line_pointers[0] - 1]
         elif len(line_pointers) == 2:
@@ -434,6 +569,7 @@ reward: -10000 currency, -1000 fortune, item_conscription_notification
 
     @commands.message_command(name="GitHub render", guild_ids=TARGET_GUILD_IDS)
     async def process_github_links(self, context: ApplicationContext, message: Message):
+        await context.defer(ephemeral=True)
         content = message.content
         links = re.findall(self.url_regex, content)
         links = [link[0] for link in links]
@@ -450,24 +586,31 @@ reward: -10000 currency, -1000 fortune, item_conscription_notification
                 object_id, link_type, sub_object_id = self.process_object_id(object_id)
             view = None
             if link_type == "issues" or link_type == "issue":
-                status, data = await get_issue_by_number(self.bot.session, repo_name, object_id)
+                status, data = await get_issue_details(
+                    self.bot.session, repo_name, object_id, RequestPriority.NORMAL
+                )
                 if not status:
                     continue
                 embed = await get_issue_embed(self.bot.session, data, object_id, repo_name, link)
                 view = IssueControls(self.bot.session, repo_name, object_id, data)
             elif link_type == "pull":
-                status, data = await get_pull_request_by_number(self.bot.session, repo_name, object_id)
+                status, data = await get_pull_request_details(
+                    self.bot.session, repo_name, object_id, RequestPriority.NORMAL
+                )
                 if not status:
                     continue
                 embed = await get_pull_request_embed(self.bot.session, data, object_id, repo_name, link)
                 view = IssueControls(self.bot.session, repo_name, object_id, data)
             elif link_type == "issuecomment":
-                status, data = await get_issue_comment(self.bot.session, repo_name, sub_object_id)
+                status, data = await get_issue_comment(
+                    self.bot.session, repo_name, sub_object_id, RequestPriority.NORMAL
+                )
                 if not status:
                     continue
                 embed = await get_issue_comment_embed(self.bot.session, data, object_id, repo_name, link)
             else:
-                return
+                # interaction is deferred, so the loop must reach the followup below
+                continue
             if view:
                 msg = await message.channel.send(embed=embed, view=view)
                 view.assign_message(msg)
@@ -492,6 +635,17 @@ reward: -10000 currency, -1000 fortune, item_conscription_notification
             msg = f"No associated Github username for {user.mention} stored!"
         await context.send(msg)
 
+    @commands.command()
+    @commands.has_permissions(manage_messages=True)
+    async def refresh_github_cache(self, context: commands.Context, repo_name: Optional[str] = None):
+        """ Drops cached labels, milestones and team members (of given repo shortcut, or all of them) """
+        full_repo_name = PRESET_REPOSITORIES.get(repo_name.lower(), repo_name) if repo_name else None
+        dropped = invalidate_repo_metadata(full_repo_name)
+        if full_repo_name:
+            # team members aren't bound to any repo
+            dropped += invalidate_repo_metadata("arcadia-redux")
+        await context.send(f"Dropped {dropped} cached entries, they'll be reloaded on next use.")
+
     @commands.command(name="issue", aliases=["i", "issues", "Issues", "I"])
     async def issue(self, context: commands.Context):
         embed = Embed(
@@ -504,12 +658,14 @@ reward: -10000 currency, -1000 fortune, item_conscription_notification
         usage = """
 `$add_github_name @mention github_username` - assign github name to mentioned user
 `$github_name @mention` - get assigned github name of mentioned user
+`$refresh_github_cache [shortcut]` - reload labels, milestones and team members on next use
         """
         embed.add_field(name="Usage", value=usage, inline=False)
         reply_description = """
             You can reply to "Opened new issue..." messages from bot to interact with newly opened issue directly.
-            Text is interpreted as comments, image attachments are supported.
-            Also can be used with starting keyword for different actions:
+            Text is interpreted as comments, all image attachments are added to the same comment.
+            Also can be used with starting keyword for different actions,
+            several of them can be combined in one reply, one per line:
 ```
 label: bug "help wanted" enhancement "under review"
 assign: darklordabc SanctusAnimus ZLOY5
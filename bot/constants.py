@@ -21,6 +21,10 @@ GITHUB_API_HEADERS = {
     "Accept": "application/vnd.github.v3+json",
 }
 
+GITHUB_CACHE_IN_REDIS = getenv("GITHUB_CACHE_IN_REDIS", "1") == "1"
+ISSUE_MIRROR_PATH = getenv("ISSUE_MIRROR_PATH", "issue_mirror.sqlite3")
+ISSUE_MIRROR_SYNC_MINUTES = float(getenv("ISSUE_MIRROR_SYNC_MINUTES", 10))
+
 PRIVATE_REPOSITORIES = [
     "custom_hero_clash", "chclash_webserver",
     "arcadia_automation_bot", "overthrow_3",
@@ -47,5 +51,18 @@ SERVER_LINKS = {
 CUSTOM_GAMES: Final[Dict[str, Any]] = {key: None for key in SERVER_LINKS.keys()}
 CUSTOM_GAMES_LIST = list(SERVER_LINKS.keys())
 
+SUGGESTION_WORKERS = int(getenv("SUGGESTION_WORKERS", 8))
+SUGGESTION_QUEUE_SIZE = int(getenv("SUGGESTION_QUEUE_SIZE", 1000))
+CHAT_QUEUE_SIZE = int(getenv("CHAT_QUEUE_SIZE", 200))
+CHAT_QUEUE_SUMMARIZE_OVERFLOW = getenv("CHAT_QUEUE_OVERFLOW", "summarize") == "summarize"
+CHAT_RELAY_ATTEMPTS = int(getenv("CHAT_RELAY_ATTEMPTS", 3))
+
+INGESTION_MODE = getenv("INGESTION_MODE", "pubsub")  # "pubsub" or "streams"
+SUGGESTIONS_STREAM = getenv("SUGGESTIONS_STREAM", "suggestions-stream")
+CHAT_STREAM = getenv("CHAT_STREAM", "chat-stream")
+STREAM_GROUP = getenv("STREAM_GROUP", "discord-bot")
+STREAM_CONSUMER = getenv("STREAM_CONSUMER", "bot")
+STREAM_MAX_LEN = int(getenv("STREAM_MAX_LEN", 100000))
+
 Numeric = Union[str, int]
 ApiResponse = Tuple[bool, Union[dict, list]]
@@ -1,4 +1,4 @@
-from enum import Enum, auto
+from enum import Enum, IntEnum, auto
 
 
 class BotState(Enum):
@@ -15,3 +15,10 @@ class ApiRequestKind(Enum):
 
     def __str__(self):
         return self.name.lower()
+
+
+class RequestPriority(IntEnum):
+    """ Lower value is served first """
+    HIGH = 0
+    NORMAL = 1
+    BULK = 2
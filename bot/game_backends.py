@@ -0,0 +1,154 @@
+import asyncio
+import random
+from time import monotonic
+from typing import Dict, NamedTuple, Optional
+
+from aiohttp import ClientError, ClientTimeout
+from loguru import logger
+
+from .constants import SERVER_LINKS
+
+
+class EndpointPolicy(NamedTuple):
+    budget: float  # seconds for the whole call, retries included
+    idempotent: bool = False  # only idempotent calls are retried
+    max_attempts: int = 3
+
+
+ENDPOINT_POLICIES: Dict[str, EndpointPolicy] = {
+    "/api/lua/match/send_dev_chat_message": EndpointPolicy(budget=5),
+    "/api/lua/match/mute_player_in_chat": EndpointPolicy(budget=10, idempotent=True),
+    "/api/lua/match/unmute_player_in_chat": EndpointPolicy(budget=10, idempotent=True),
+    "/api/lua/mail/feedback_reply": EndpointPolicy(budget=10),
+}
+DEFAULT_POLICY = EndpointPolicy(budget=10)
+
+
+class BackendResponse(NamedTuple):
+    ok: bool
+    status: Optional[int]  # None if backend wasn't reached (timeout, connection error, open circuit)
+    text: str
+
+
+class CircuitBreaker:
+    """
+    Opens after consecutive failures, failing calls immediately for reset_timeout.
+    Then lets single trial call through: its success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def abandon(self):
+        """ Call was cancelled without result """
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            self.opened_at = monotonic()
+        self._trial_running = False
+
+
+class GameBackend:
+    """
+    Client of single game backend. Every call is bound by latency budget of its endpoint,
+    idempotent calls are retried with jittered exponential backoff within that budget.
+    Circuit breaker makes calls fail fast while backend is down.
+    """
+
+    def __init__(self, name: str, base_url: str, http, backoff: float = 0.5):
+        self.name = name
+        self.base_url = base_url
+        self.http = http
+        self.backoff = backoff
+        self.breaker = CircuitBreaker()
+
+        self.calls = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def post(self, path: str, payload: dict, headers: Optional[dict] = None) -> BackendResponse:
+        policy = ENDPOINT_POLICIES.get(path, DEFAULT_POLICY)
+        deadline = monotonic() + policy.budget
+        attempts = policy.max_attempts if policy.idempotent else 1
+        self.calls += 1
+
+        response = BackendResponse(False, None, "")
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                self.rejected += 1
+                return BackendResponse(False, None, f"{self.name} backend is unavailable")
+            remaining = deadline - monotonic()
+            try:
+                response = await self._post_once(path, payload, headers, remaining)
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            # client errors are answers of healthy backend, and won't change on retry
+            if response.status is not None and response.status < 500:
+                self.breaker.record_success()
+                return response
+            self.breaker.record_failure()
+
+            delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            if attempt + 1 >= attempts or monotonic() + delay >= deadline:
+                break
+            await asyncio.sleep(delay)
+
+        self.failed += 1
+        logger.warning(f"[{self.name}] {path} failed: {response.status} {response.text[:200]}")
+        return response
+
+    async def _post_once(self, path: str, payload: dict, headers: Optional[dict], timeout: float) -> BackendResponse:
+        try:
+            async with self.http.post(
+                f"{self.base_url}{path}", json=payload, headers=headers, timeout=ClientTimeout(total=timeout)
+            ) as response:
+                return BackendResponse(response.status < 400, response.status, await response.text())
+        except asyncio.TimeoutError:
+            return BackendResponse(False, None, f"timed out after {timeout:.1f}s")
+        except ClientError as error:
+            return BackendResponse(False, None, repr(error))
+
+    def describe(self) -> str:
+        return f"{self.name} {self.breaker.state}, {self.calls} calls, {self.failed} failed, {self.rejected} rejected"
+
+
+class GameBackends:
+    def __init__(self, http):
+        self.backends = {
+            custom_game: GameBackend(custom_game, link, http) for custom_game, link in SERVER_LINKS.items()
+        }
+
+    def get(self, custom_game: str) -> Optional[GameBackend]:
+        return self.backends.get(custom_game, None)
+
+    def describe(self) -> str:
+        return f"**Game backends**: {'; '.join(backend.describe() for backend in self.backends.values())}"
@@ -0,0 +1,70 @@
+import json
+from typing import Optional, Dict
+
+from loguru import logger
+
+from .cache import TTLCache
+
+
+class GithubResponseCache:
+    """
+    Stores bodies of GitHub GET responses together with their validators (ETag / Last-Modified),
+    so repeated requests can be made conditional. Bodies are kept serialized, every caller gets its own copy.
+    """
+
+    def __init__(self, max_size: int = 2048, redis_ttl: int = 24 * 60 * 60):
+        self.memory = TTLCache(max_size=max_size)
+        self.redis = None
+        self.redis_ttl = redis_ttl
+
+        self.not_modified = 0
+        self.modified = 0
+
+    def attach_redis(self, redis):
+        self.redis = redis
+
+    @staticmethod
+    def _redis_key(path: str) -> str:
+        return f"github-response:{path}"
+
+    async def get(self, path: str) -> Optional[dict]:
+        entry = self.memory.get(path)
+        if entry is not None or not self.redis:
+            return entry
+        try:
+            raw = await self.redis.get(self._redis_key(path), encoding="utf8")
+        except Exception:
+            logger.exception(f"[GitHub cache] Failed reading {path}")
+            return None
+        if not raw:
+            return None
+        entry = json.loads(raw)
+        self.memory.set(path, entry)
+        return entry
+
+    async def set(self, path: str, etag: Optional[str], last_modified: Optional[str], body: str,
+                  link: Optional[str] = None):
+        entry = {"etag": etag, "last_modified": last_modified, "body": body, "link": link}
+        self.memory.set(path, entry)
+        if not self.redis:
+            return
+        try:
+            await self.redis.set(self._redis_key(path), json.dumps(entry), expire=self.redis_ttl)
+        except Exception:
+            logger.exception(f"[GitHub cache] Failed storing {path}")
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> Dict[str, str]:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def describe(self) -> str:
+        return f"**GitHub responses**: {self.memory.describe()}, {self.not_modified} not modified (304), " \
+               f"{self.modified} refetched"
+
+
+response_cache = GithubResponseCache()
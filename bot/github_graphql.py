@@ -0,0 +1,202 @@
+import asyncio
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import ClientSession
+from loguru import logger
+
+from .constants import ApiResponse, Numeric
+from .enums import ApiRequestKind, RequestPriority
+from .github_integration import github_api_request, get_issue_by_number, get_pull_request_by_number
+
+IssueReference = Tuple[str, int]
+
+REFERENCES_PER_QUERY = 50
+REST_FALLBACK_CONCURRENCY = 5
+
+_REFERENCE_FIELDS = """
+    ... on Issue { number title state url }
+    ... on PullRequest { number title state url }
+"""
+
+
+async def graphql_request(session: ClientSession, query: str, variables: Optional[dict] = None,
+                          priority: RequestPriority = RequestPriority.NORMAL) -> ApiResponse:
+    """
+    Performs GraphQL query. Partial results are still successful: GitHub reports missing objects as errors,
+    while returning everything else.
+    """
+    status, response = await github_api_request(
+        session, ApiRequestKind.POST, "/graphql", {"query": query, "variables": variables or {}}, priority
+    )
+    if not status or not response.get("data"):
+        logger.warning(f"[GraphQL] Query failed: {response}")
+        return False, response
+    if response.get("errors"):
+        logger.info(f"[GraphQL] Query returned errors: {response['errors']}")
+    return True, response["data"]
+
+
+def _rest_shaped_reference(data: dict) -> dict:
+    return {
+        "number": data["number"],
+        "title": data["title"],
+        "state": "open" if data["state"] == "OPEN" else "closed",
+        "html_url": data["url"],
+    }
+
+
+_COMMON_FIELDS = """
+    number title state url body createdAt updatedAt
+    author { login avatarUrl }
+    labels(first: 50) { nodes { name } }
+    assignees(first: 20) { nodes { login } }
+    milestone { number title description }
+    comments { totalCount }
+"""
+
+_EMBED_QUERY = """
+query($repo: String!, $number: Int!) {
+    repository(owner: "arcadia-redux", name: $repo) {
+        issueOrPullRequest(number: $number) {
+            __typename
+            ... on Issue { %(common)s }
+            ... on PullRequest {
+                %(common)s
+                isDraft merged mergeable mergeStateStatus additions deletions changedFiles
+                commits { totalCount }
+                reviewRequests(first: 20) { nodes { requestedReviewer { ... on User { login } } } }
+            }
+        }
+    }
+}
+""" % {"common": _COMMON_FIELDS}
+
+_MERGEABLE_STATES = {"MERGEABLE": True, "CONFLICTING": False}
+
+
+def _rest_shaped_issue(data: dict) -> dict:
+    """ Converts GraphQL issue / pull request into the shape of REST API response, as expected by embeds and views """
+    author = data.get("author") or {}
+    issue = {
+        "number": data["number"],
+        "title": data["title"],
+        "state": "open" if data["state"] == "OPEN" else "closed",
+        "html_url": data["url"],
+        "body": data["body"],
+        "created_at": data["createdAt"],
+        "updated_at": data["updatedAt"],
+        "user": {"login": author.get("login", "ghost"), "avatar_url": author.get("avatarUrl", "")},
+        "labels": data["labels"]["nodes"],
+        "assignees": data["assignees"]["nodes"],
+        "milestone": data["milestone"],
+        "comments": data["comments"]["totalCount"],
+    }
+    if data["__typename"] == "PullRequest":
+        issue.update({
+            "draft": data["isDraft"],
+            "merged": data["merged"],
+            "mergeable": _MERGEABLE_STATES.get(data["mergeable"], None),
+            "mergeable_state": data["mergeStateStatus"].lower(),
+            "additions": data["additions"],
+            "deletions": data["deletions"],
+            "changed_files": data["changedFiles"],
+            "commits": data["commits"]["totalCount"],
+            "requested_reviewers": [
+                request["requestedReviewer"] for request in data["reviewRequests"]["nodes"]
+                if request.get("requestedReviewer")
+            ],
+            "pull_request": {"html_url": data["url"]},
+        })
+    return issue
+
+
+async def _get_embed_data_graphql(session: ClientSession, repo: str, number: int,
+                                  priority: RequestPriority) -> Optional[dict]:
+    status, data = await graphql_request(session, _EMBED_QUERY, {"repo": repo, "number": int(number)}, priority)
+    if not status:
+        return None
+    issue_data = (data.get("repository") or {}).get("issueOrPullRequest")
+    return _rest_shaped_issue(issue_data) if issue_data else None
+
+
+async def get_issue_details(session: ClientSession, repo: str, number: Numeric,
+                            priority: RequestPriority = RequestPriority.NORMAL) -> ApiResponse:
+    """
+    Everything issue embed needs in a single GraphQL request, shaped as REST issue.
+    Falls back to REST API if GraphQL request fails.
+    """
+    if data := await _get_embed_data_graphql(session, repo, number, priority):
+        return True, data
+    return await get_issue_by_number(session, repo, number, priority)
+
+
+async def get_pull_request_details(session: ClientSession, repo: str, number: Numeric,
+                                   priority: RequestPriority = RequestPriority.NORMAL) -> ApiResponse:
+    """
+    Everything pull request embed needs (including merge state and diff stats) in a single GraphQL request,
+    shaped as REST pull request. Falls back to REST API if GraphQL request fails.
+    """
+    data = await _get_embed_data_graphql(session, repo, number, priority)
+    if data and "merged" in data:
+        return True, data
+    return await get_pull_request_by_number(session, repo, number, priority)
+
+
+async def get_issue_references(session: ClientSession, references: Iterable[IssueReference],
+                               priority: RequestPriority = RequestPriority.NORMAL) -> Dict[IssueReference, dict]:
+    """
+    Resolves (repo, number) pairs of issues or pull requests into their number, title, state and html_url,
+    with single GraphQL query per 50 unique references. Falls back to concurrent REST requests if GraphQL fails.
+    Unresolved references are missing from result.
+    """
+    unique_references = list(dict.fromkeys((repo, int(number)) for repo, number in references))
+    resolved: Dict[IssueReference, dict] = {}
+    for i in range(0, len(unique_references), REFERENCES_PER_QUERY):
+        chunk = unique_references[i:i + REFERENCES_PER_QUERY]
+        chunk_resolved = await _get_issue_references_graphql(session, chunk, priority)
+        if chunk_resolved is None:
+            chunk_resolved = await _get_issue_references_rest(session, chunk, priority)
+        resolved.update(chunk_resolved)
+    return resolved
+
+
+async def _get_issue_references_graphql(session: ClientSession, references: List[IssueReference],
+                                        priority: RequestPriority) -> Optional[Dict[IssueReference, dict]]:
+    repos: Dict[str, List[int]] = {}
+    for repo, number in references:
+        repos.setdefault(repo, []).append(number)
+
+    repo_aliases = {f"r{i}": repo for i, repo in enumerate(repos.keys())}
+    variables_definition = ", ".join(f"${alias}: String!" for alias in repo_aliases.keys())
+    repo_queries = []
+    for alias, repo in repo_aliases.items():
+        issue_queries = " ".join(
+            f"n{number}: issueOrPullRequest(number: {number}) {{ {_REFERENCE_FIELDS} }}" for number in repos[repo]
+        )
+        repo_queries.append(f'{alias}: repository(owner: "arcadia-redux", name: ${alias}) {{ {issue_queries} }}')
+    query = f"query({variables_definition}) {{ {' '.join(repo_queries)} }}"
+
+    status, data = await graphql_request(session, query, repo_aliases, priority)
+    if not status:
+        return None
+    resolved = {}
+    for alias, repo in repo_aliases.items():
+        repo_data = data.get(alias) or {}
+        for number in repos[repo]:
+            if issue_data := repo_data.get(f"n{number}"):
+                resolved[(repo, number)] = _rest_shaped_reference(issue_data)
+    return resolved
+
+
+async def _get_issue_references_rest(session: ClientSession, references: List[IssueReference],
+                                     priority: RequestPriority) -> Dict[IssueReference, dict]:
+    semaphore = asyncio.Semaphore(REST_FALLBACK_CONCURRENCY)
+
+    async def _resolve(repo: str, number: int):
+        async with semaphore:
+            return await get_issue_by_number(session, repo, number, priority)
+
+    responses = await asyncio.gather(*[_resolve(repo, number) for repo, number in references])
+    return {
+        reference: data for reference, (status, data) in zip(references, responses) if status
+    }
@@ -1,12 +1,24 @@
-from typing import Optional, List, Dict, Any
+import asyncio
+import json
+import re
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator
+from urllib.parse import urlencode
 
 from aiohttp import ClientSession
 from discord import Message, Member
 from discord.commands import ApplicationContext
 from discord.ext.commands import Context
+from loguru import logger
 
 from .constants import Numeric, ApiResponse, GITHUB_API_URL, GITHUB_API_HEADERS
-from .enums import ApiRequestKind
+from .enums import ApiRequestKind, RequestPriority
+from .github_cache import response_cache
+from .github_scheduler import github_scheduler
+from .repo_metadata import RepoMetadataCache
+
+repo_metadata = RepoMetadataCache()
+
+_next_link_regex = re.compile(r'<([^>]+)>;\s*rel="next"')
 
 
 def body_wrap(body: str, context: Context) -> str:
@@ -46,10 +58,127 @@ def comment_wrap_interaction(body: str, context: ApplicationContext, ref_message
 
 
 async def github_api_request(session: ClientSession, request_kind: ApiRequestKind, request_path: str,
-                             body: Optional[dict] = None) -> ApiResponse:
+                             body: Optional[dict] = None, priority: Optional[RequestPriority] = None) -> ApiResponse:
+    """
+    Performs GitHub API request through rate limit aware scheduler, retrying when rate limited.
+    Changes are made with high priority by default, reads - with normal one.
+    """
+    status, data, _ = await _github_api_request(session, request_kind, request_path, body, priority)
+    return status, data
+
+
+async def github_api_request_page(session: ClientSession, request_path: str,
+                                  priority: Optional[RequestPriority] = None) -> Tuple[bool, Any, Optional[str]]:
+    """ Requests single page of list endpoint, returning path of the next page (from `Link` header) as well """
+    return await _github_api_request(session, ApiRequestKind.GET, request_path, None, priority)
+
+
+async def _github_api_request(session: ClientSession, request_kind: ApiRequestKind, request_path: str,
+                              body: Optional[dict],
+                              priority: Optional[RequestPriority]) -> Tuple[bool, Any, Optional[str]]:
+    if priority is None:
+        priority = RequestPriority.NORMAL if request_kind == ApiRequestKind.GET else RequestPriority.HIGH
+    attempt = 0
+    while True:
+        async with github_scheduler.slot(request_path, priority):
+            status, data, link, retry_delay = await _github_api_request_once(
+                session, request_kind, request_path, body, attempt
+            )
+        if retry_delay is None:
+            return status, data, _next_page_path(link)
+        await asyncio.sleep(retry_delay)
+        attempt += 1
+
+
+def _next_page_path(link: Optional[str]) -> Optional[str]:
+    if not link or not (match := _next_link_regex.search(link)):
+        return None
+    url = match.group(1)
+    return url[len(GITHUB_API_URL):] if url.startswith(GITHUB_API_URL) else None
+
+
+async def _github_api_request_once(session: ClientSession, request_kind: ApiRequestKind, request_path: str,
+                                   body: Optional[dict],
+                                   attempt: int) -> Tuple[bool, Any, Optional[str], Optional[float]]:
     completed_request_path = GITHUB_API_URL + request_path
-    response = await getattr(session, str(request_kind))(completed_request_path, json=body, headers=GITHUB_API_HEADERS)
-    return response.status < 400, await response.json()
+    cached = None
+    headers = GITHUB_API_HEADERS
+    if request_kind == ApiRequestKind.GET:
+        # GET requests are made conditional, 304 responses are served from cache and don't count against rate limit
+        cached = await response_cache.get(request_path)
+        if cached:
+            headers = {**GITHUB_API_HEADERS, **response_cache.conditional_headers(cached)}
+
+    async with getattr(session, str(request_kind))(completed_request_path, json=body, headers=headers) as response:
+        response_text = await response.text()
+    retry_delay = github_scheduler.update(request_path, response.status, response.headers, attempt, response_text)
+    if retry_delay is not None:
+        return False, None, None, retry_delay
+
+    if response.status == 304 and cached:
+        response_cache.not_modified += 1
+        return True, json.loads(cached["body"]), cached.get("link"), None
+
+    etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+    link = response.headers.get("Link")
+    if request_kind == ApiRequestKind.GET and response.status == 200 and (etag or last_modified):
+        response_cache.modified += 1
+        await response_cache.set(request_path, etag, last_modified, response_text, link)
+    return response.status < 400, json.loads(response_text) if response_text else {}, link, None
+
+
+class GithubRequestError(Exception):
+    """ Request of page iteration failed. Iteration can be resumed from request_path of the failed page """
+
+    def __init__(self, request_path: str, details: Any):
+        super().__init__(f"Failed fetching {request_path}: {details}")
+        self.request_path = request_path
+        self.details = details
+
+
+def _with_per_page(request_path: str, per_page: int) -> str:
+    if "per_page=" in request_path:
+        return request_path
+    separator = "&" if "?" in request_path else "?"
+    return f"{request_path}{separator}per_page={per_page}"
+
+
+async def github_api_request_all_pages(session: ClientSession, request_path: str, per_page: int = 100,
+                                      priority: Optional[RequestPriority] = None) -> ApiResponse:
+    """ Collects every page of list endpoint """
+    results = []
+    next_path = _with_per_page(request_path, per_page)
+    while next_path:
+        status, data, next_path = await github_api_request_page(session, next_path, priority)
+        if not status:
+            return status, data
+        results.extend(data)
+    return True, results
+
+
+async def github_api_iterate_pages(session: ClientSession, request_path: str, per_page: int = 100,
+                                   priority: Optional[RequestPriority] = None) -> AsyncIterator[list]:
+    """
+    Streams pages of list endpoint, following `Link` header. Next page is requested in background
+    while consumer processes current one; stopping iteration (or closing generator) cancels pending request.
+    Raises GithubRequestError on request error.
+    """
+    page_path = _with_per_page(request_path, per_page)
+    pending = asyncio.ensure_future(github_api_request_page(session, page_path, priority))
+    try:
+        while pending:
+            status, data, next_path = await pending
+            pending = None
+            if not status:
+                logger.warning(f"[GitHub] Failed fetching {page_path}: {data}")
+                raise GithubRequestError(page_path, data)
+            if page_path := next_path:
+                pending = asyncio.ensure_future(github_api_request_page(session, page_path, priority))
+            if data:
+                yield data
+    finally:
+        if pending and not pending.done():
+            pending.cancel()
 
 
 async def open_issue(context: Context, repo: str, title: str, body: Optional[str] = "") -> ApiResponse:
@@ -119,21 +248,17 @@ async def deassign_issue(session: ClientSession, repo: str, issue_id: Numeric, a
     )
 
 
-async def get_issues(session: ClientSession, repo: str, count: Numeric, state: str, page: Numeric) -> ApiResponse:
-    return await github_api_request(
-        session, ApiRequestKind.GET,
-        f"/repos/arcadia-redux/{repo}/issues?per_page={count}&state={state}&page={page}",
-        {}
+def iterate_issue_pages(session: ClientSession, repo: str, state: str, per_page: Numeric = 30,
+                        priority: Optional[RequestPriority] = RequestPriority.NORMAL) -> AsyncIterator[list]:
+    """ Streams issues of repo page by page, prefetching the next one """
+    return github_api_iterate_pages(
+        session, f"/repos/arcadia-redux/{repo}/issues?state={state}", int(per_page), priority
     )
 
 
-async def get_issues_list_formatted(session: ClientSession, repo: str, state: str, count: Numeric,
-                                    page: Numeric) -> str:
-    status, data = await get_issues(session, repo, count, state, page)
-    if not status:
-        return ""
+def format_issue_list(issues: List[dict]) -> str:
     description_list = []
-    for issue in data:
+    for issue in issues:
         issue_state = "🟢" if issue['state'] == "open" else "🔴"
         description_list.append(
             f"{issue_state} [`#{issue['number']}`]({issue['html_url']}) {issue['title']}"
@@ -141,15 +266,36 @@ async def get_issues_list_formatted(session: ClientSession, repo: str, state: st
     return "\n".join(description_list)
 
 
-async def get_issue_by_number(session: ClientSession, repo: str, issue_id: Numeric) -> ApiResponse:
+async def get_issues_list_formatted(session: ClientSession, repo: str, state: str, count: Numeric,
+                                    page: Numeric = 1) -> str:
+    """ Formatted page of `count` issues, streamed from issue pages only until enough are collected """
+    count = int(count)
+    skip = (int(page) - 1) * count
+    issues = []
+    pages = iterate_issue_pages(session, repo, state, min(count, 100))
+    try:
+        async for issues_page in pages:
+            issues.extend(issues_page)
+            if len(issues) >= skip + count:
+                break
+    except GithubRequestError:
+        return ""
+    finally:
+        await pages.aclose()
+    return format_issue_list(issues[skip:skip + count])
+
+
+async def get_issue_by_number(session: ClientSession, repo: str, issue_id: Numeric,
+                              priority: Optional[RequestPriority] = None) -> ApiResponse:
     return await github_api_request(
-        session, ApiRequestKind.GET, f"/repos/arcadia-redux/{repo}/issues/{issue_id}"
+        session, ApiRequestKind.GET, f"/repos/arcadia-redux/{repo}/issues/{issue_id}", priority=priority
     )
 
 
-async def get_pull_request_by_number(session: ClientSession, repo: str, pull_id: Numeric) -> ApiResponse:
+async def get_pull_request_by_number(session: ClientSession, repo: str, pull_id: Numeric,
+                                     priority: Optional[RequestPriority] = None) -> ApiResponse:
     return await github_api_request(
-        session, ApiRequestKind.GET, f"/repos/arcadia-redux/{repo}/pulls/{pull_id}"
+        session, ApiRequestKind.GET, f"/repos/arcadia-redux/{repo}/pulls/{pull_id}", priority=priority
     )
 
 
@@ -166,15 +312,15 @@ async def get_commits_diff(session: ClientSession, repo: str, base: str, head: s
 
 
 async def get_repo_labels(session: ClientSession, repo: str) -> ApiResponse:
-    return await github_api_request(
-        session, ApiRequestKind.GET, f"/repos/arcadia-redux/{repo}/labels"
-    )
+    return await repo_metadata.get((repo, "labels"), lambda: github_api_request_all_pages(
+        session, f"/repos/arcadia-redux/{repo}/labels"
+    ))
 
 
 async def get_arcadia_team_members(session: ClientSession) -> ApiResponse:
-    return await github_api_request(
-        session, ApiRequestKind.GET, f"/organizations/46830822/team/4574724/members"
-    )
+    return await repo_metadata.get(("arcadia-redux", "team_members"), lambda: github_api_request_all_pages(
+        session, f"/organizations/46830822/team/4574724/members"
+    ))
 
 
 async def get_repo_single_label(session: ClientSession, repo: str, label_name: str) -> ApiResponse:
@@ -185,16 +331,21 @@ async def get_repo_single_label(session: ClientSession, repo: str, label_name: s
 
 async def create_repo_label(session: ClientSession, repo: str, label_name: str, color: Optional[str] = None,
                             description: Optional[str] = None) -> ApiResponse:
-    return await github_api_request(
+    status, data = await github_api_request(
         session, ApiRequestKind.POST, f"/repos/arcadia-redux/{repo}/labels", {
             "name": label_name,
             "color": color,
             "description": description,
         }
     )
+    # invalidated only once label exists, so concurrent lookups can't cache list without it again
+    if status:
+        repo_metadata.invalidate(repo, "labels")
+    return status, data
 
 
-async def set_issue_milestone(session: ClientSession, repo: str, issue_id: Numeric, milestone: str) -> ApiResponse:
+async def find_milestone_number(session: ClientSession, repo: str, milestone: str) -> Tuple[bool, Any]:
+    """ Looks up milestone number by its (case insensitive) title """
     status, repo_milestones = await get_repo_milestones(session, repo)
     if not status:
         return status, repo_milestones
@@ -206,25 +357,35 @@ async def set_issue_milestone(session: ClientSession, repo: str, issue_id: Numer
     milestone_number = milestone_dict.get("number", None)
     if not milestone_number:
         return False, {"error": f"No milestone with name `{milestone}`"}
+    return True, milestone_number
+
+
+async def set_issue_milestone(session: ClientSession, repo: str, issue_id: Numeric, milestone: str) -> ApiResponse:
+    status, milestone_number = await find_milestone_number(session, repo, milestone)
+    if not status:
+        return status, milestone_number
     return await set_issue_milestone_raw(session, repo, issue_id, milestone_number)
 
 
 async def set_issue_milestone_raw(
         session: ClientSession, repo: str, issue_id: Numeric, milestone_number: int
 ) -> ApiResponse:
-    issue_body = {
-        "milestone": milestone_number
-    }
-    resp = await session.patch(
-        f"{GITHUB_API_URL}/repos/arcadia-redux/{repo}/issues/{issue_id}", json=issue_body, headers=GITHUB_API_HEADERS,
+    return await github_api_request(
+        session, ApiRequestKind.PATCH, f"/repos/arcadia-redux/{repo}/issues/{issue_id}", {
+            "milestone": milestone_number
+        }
     )
-    return resp.status < 400, await resp.json()
 
 
 async def get_repo_milestones(session: ClientSession, repo: str) -> ApiResponse:
-    return await github_api_request(
-        session, ApiRequestKind.GET, f"/repos/arcadia-redux/{repo}/milestones"
-    )
+    return await repo_metadata.get((repo, "milestones"), lambda: github_api_request_all_pages(
+        session, f"/repos/arcadia-redux/{repo}/milestones"
+    ))
+
+
+def invalidate_repo_metadata(repo: Optional[str] = None) -> int:
+    """ Drops cached labels, milestones and team members, forcing them to be reloaded on next use """
+    return repo_metadata.invalidate(repo)
 
 
 async def comment_issue(session: ClientSession, repo: str, issue_id: Numeric, body: str) -> ApiResponse:
@@ -235,33 +396,42 @@ async def comment_issue(session: ClientSession, repo: str, issue_id: Numeric, bo
     )
 
 
-async def get_issue_comment(session: ClientSession, repo: str, comment_id: Numeric) -> ApiResponse:
+async def get_issue_comment(session: ClientSession, repo: str, comment_id: Numeric,
+                            priority: Optional[RequestPriority] = None) -> ApiResponse:
     return await github_api_request(
-        session, ApiRequestKind.GET, f"/repos/arcadia-redux/{repo}/issues/comments/{comment_id}"
+        session, ApiRequestKind.GET, f"/repos/arcadia-redux/{repo}/issues/comments/{comment_id}",
+        priority=priority
     )
 
 
 async def get_issue_comments(
-        session: ClientSession, repo: str, issue_number: Numeric, since: Optional[str] = None
+        session: ClientSession, repo: str, issue_number: Numeric, since: Optional[str] = None,
+        priority: Optional[RequestPriority] = None
 ) -> ApiResponse:
     if since:
         url = f"/repos/arcadia-redux/{repo}/issues/{issue_number}/comments?since={since}"
     else:
         url = f"/repos/arcadia-redux/{repo}/issues/{issue_number}/comments"
     return await github_api_request(
-        session, ApiRequestKind.GET, url
+        session, ApiRequestKind.GET, url, priority=priority
+    )
+
+
+def iterate_issue_comment_pages(session: ClientSession, repo: str, issue_number: Numeric, per_page: int = 100,
+                                priority: Optional[RequestPriority] = RequestPriority.NORMAL) -> AsyncIterator[list]:
+    """ Streams comments of issue in chronological order, page by page """
+    return github_api_iterate_pages(
+        session, f"/repos/arcadia-redux/{repo}/issues/{issue_number}/comments", per_page, priority
     )
 
 
 async def search_issues(session: ClientSession, repo: str, query: str,
                         page_num: Optional[Numeric] = 1, per_page: Optional[Numeric] = 10) -> ApiResponse:
-    request_body = {
+    request_params = {
         "q": f"repo:arcadia-redux/{repo} {query}",
         "per_page": per_page,
         "page": page_num
     }
-
-    resp = await session.get(
-        f"{GITHUB_API_URL}/search/issues", headers=GITHUB_API_HEADERS, params=request_body
+    return await github_api_request(
+        session, ApiRequestKind.GET, f"/search/issues?{urlencode(request_params)}"
     )
-    return resp.status < 400, await resp.json()
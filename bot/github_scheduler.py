@@ -0,0 +1,157 @@
+import asyncio
+import heapq
+import random
+from contextlib import asynccontextmanager
+from itertools import count
+from time import time
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from .enums import RequestPriority
+
+
+class _RateBucket:
+    __slots__ = ("remaining", "limit", "reset_at", "blocked_until")
+
+    def __init__(self):
+        self.remaining: Optional[int] = None
+        self.limit: Optional[int] = None
+        self.reset_at: float = 0
+        self.blocked_until: float = 0  # set by secondary rate limits and Retry-After
+
+
+class GithubScheduler:
+    """
+    Central gate for every GitHub API call.
+    Tracks remaining budget of each rate limit resource from response headers, and hands out request slots
+    by priority. Lower priority requests are held back once budget drops below their reserve, so bulk work
+    (rendering, paging) can't starve interactive actions. Secondary rate limits pause requests of their resource.
+    """
+
+    def __init__(self, concurrency: int = 8, reserves: Optional[Dict[RequestPriority, int]] = None,
+                 max_attempts: int = 4):
+        self.concurrency = concurrency
+        self.reserves = reserves or {
+            RequestPriority.HIGH: 0,
+            RequestPriority.NORMAL: 100,
+            RequestPriority.BULK: 1000,
+        }
+        self.max_attempts = max_attempts
+
+        self.buckets: Dict[str, _RateBucket] = {}
+        self.delayed: Dict[RequestPriority, int] = {priority: 0 for priority in RequestPriority}
+        self.retried = 0
+
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = count()
+
+    @staticmethod
+    def resource_of(request_path: str) -> str:
+        if request_path.startswith("/search"):
+            return "search"
+        if request_path.startswith("/graphql"):
+            return "graphql"
+        return "core"
+
+    def _budget_delay(self, resource: str, priority: RequestPriority) -> float:
+        now = time()
+        bucket = self.buckets.get(resource)
+        if not bucket:
+            return 0
+        if bucket.blocked_until > now:
+            return bucket.blocked_until - now
+        if bucket.remaining is None or now >= bucket.reset_at:
+            return 0
+        reserve = self.reserves[priority]
+        if resource != "core" and bucket.limit:
+            # search and graphql limits are much smaller, scale reserve accordingly
+            reserve = reserve * bucket.limit // 5000
+        if bucket.remaining > reserve:
+            return 0
+        return bucket.reset_at - now
+
+    @asynccontextmanager
+    async def slot(self, request_path: str, priority: RequestPriority):
+        resource = self.resource_of(request_path)
+        delay = self._budget_delay(resource, priority)
+        if delay > 0:
+            self.delayed[priority] += 1
+            logger.info(f"[GitHub] Delaying {priority.name} request to {request_path} by {delay:.0f}s")
+        while delay > 0:
+            # budget may be refreshed by other responses meanwhile, so re-check periodically
+            await asyncio.sleep(min(delay, 5))
+            delay = self._budget_delay(resource, priority)
+
+        await self._acquire(priority)
+        bucket = self.buckets.get(resource)
+        if bucket and bucket.remaining:
+            bucket.remaining -= 1  # optimistic, corrected by response headers
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: RequestPriority):
+        if self._active < self.concurrency and not self._waiters:
+            self._active += 1
+            return
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # slot was already handed over to us
+                self._release()
+            raise
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    def update(self, request_path: str, status: int, headers, attempt: int, message: str = "") -> Optional[float]:
+        """ Records rate limit headers of response. Returns delay before retry, if request should be retried """
+        # keyed the same way slots look buckets up, so a block is always seen by requests it applies to
+        resource = self.resource_of(request_path)
+        bucket = self.buckets.setdefault(resource, _RateBucket())
+        if "X-RateLimit-Remaining" in headers:
+            bucket.remaining = int(headers["X-RateLimit-Remaining"])
+            bucket.limit = int(headers.get("X-RateLimit-Limit", 0)) or bucket.limit
+            bucket.reset_at = float(headers.get("X-RateLimit-Reset", 0))
+
+        if status not in (403, 429) or attempt + 1 >= self.max_attempts:
+            return None
+
+        if retry_after := headers.get("Retry-After"):
+            delay = float(retry_after)
+        elif bucket.remaining == 0:
+            delay = max(0.0, bucket.reset_at - time())
+        elif status == 429 or "secondary rate limit" in message.lower():
+            # secondary limit without instructions, back off exponentially starting at a minute
+            delay = 60 * 2 ** attempt
+        else:
+            # plain 403 is a permission error
+            return None
+        delay += random.uniform(0, 1 + delay * 0.1)
+
+        bucket.blocked_until = max(bucket.blocked_until, time() + delay)
+        self.retried += 1
+        logger.warning(f"[GitHub] Rate limited on {request_path} ({status}), retrying in {delay:.0f}s")
+        return delay
+
+    def describe(self) -> str:
+        buckets = ", ".join(
+            f"{resource} {bucket.remaining}/{bucket.limit}" for resource, bucket in self.buckets.items()
+        )
+        delayed = ", ".join(f"{priority.name.lower()} {amount}" for priority, amount in self.delayed.items())
+        return f"**GitHub rate limits**: {buckets or 'unknown'}; {self._active} active, " \
+               f"{len(self._waiters)} waiting; delayed: {delayed}; {self.retried} retried"
+
+
+github_scheduler = GithubScheduler()
@@ -0,0 +1,97 @@
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+from aiohttp import ClientSession, TCPConnector
+
+from .constants import SERVER_LINKS
+
+
+class PoolSettings(NamedTuple):
+    limit: int
+    keepalive_timeout: float = 30
+    dns_cache_ttl: int = 300
+
+
+DEFAULT_POOL = "default"
+
+POOLS: Dict[str, PoolSettings] = {
+    "github": PoolSettings(limit=16, keepalive_timeout=60),
+    "github_raw": PoolSettings(limit=4),
+    "steam": PoolSettings(limit=4),
+    "discord_cdn": PoolSettings(limit=8),
+    **{custom_game: PoolSettings(limit=8) for custom_game in SERVER_LINKS.keys()},
+    DEFAULT_POOL: PoolSettings(limit=8),
+}
+
+POOL_HOSTS: Dict[str, str] = {
+    "api.github.com": "github",
+    "raw.githubusercontent.com": "github_raw",
+    "api.steampowered.com": "steam",
+    "cdn.discordapp.com": "discord_cdn",
+    "media.discordapp.net": "discord_cdn",
+    **{urlsplit(link).hostname: custom_game for custom_game, link in SERVER_LINKS.items()},
+}
+
+
+class HttpPools:
+    """
+    Separate connection pool (session with its own connector) for every upstream,
+    so slow or hanging host can only exhaust its own connections.
+    Mirrors request methods of ClientSession, picking pool by url host; returned request context managers
+    can be awaited as usual, but `async with` should be preferred to release connection once response is read.
+    """
+
+    def __init__(self, pools: Optional[Dict[str, PoolSettings]] = None, hosts: Optional[Dict[str, str]] = None):
+        self.pools = pools or POOLS
+        self.hosts = hosts or POOL_HOSTS
+        self.sessions: Dict[str, ClientSession] = {}
+
+    def session(self, pool: str) -> ClientSession:
+        """ Sessions are created on first use, so that connectors are bound to running event loop """
+        if (session := self.sessions.get(pool)) is None or session.closed:
+            settings = self.pools[pool]
+            connector = TCPConnector(
+                limit=settings.limit,
+                keepalive_timeout=settings.keepalive_timeout,
+                ttl_dns_cache=settings.dns_cache_ttl,
+            )
+            session = self.sessions[pool] = ClientSession(connector=connector)
+        return session
+
+    def session_for(self, url: str) -> ClientSession:
+        return self.session(self.hosts.get(urlsplit(url).hostname, DEFAULT_POOL))
+
+    def request(self, method: str, url: str, **kwargs):
+        return self.session_for(url).request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        return self.session_for(url).get(url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.session_for(url).post(url, **kwargs)
+
+    def put(self, url: str, **kwargs):
+        return self.session_for(url).put(url, **kwargs)
+
+    def patch(self, url: str, **kwargs):
+        return self.session_for(url).patch(url, **kwargs)
+
+    def delete(self, url: str, **kwargs):
+        return self.session_for(url).delete(url, **kwargs)
+
+    async def close(self):
+        for session in self.sessions.values():
+            if not session.closed:
+                await session.close()
+
+    def describe(self) -> str:
+        pools = []
+        for pool, session in self.sessions.items():
+            # aiohttp doesn't expose pool usage publicly, private attributes may be gone in other versions
+            acquired = getattr(session.connector, "_acquired", None)
+            connections = getattr(session.connector, "_conns", None)
+            in_use = len(acquired) if acquired is not None else "?"
+            idle = sum(len(idle_connections) for idle_connections in connections.values()) \
+                if connections is not None else "?"
+            pools.append(f"{pool} {in_use}/{self.pools[pool].limit} in use, {idle} idle")
+        return f"**HTTP pools**: {'; '.join(pools) or 'none opened yet'}"
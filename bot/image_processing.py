@@ -0,0 +1,125 @@
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, NamedTuple, Optional
+
+from PIL import Image, features
+
+# downloads are aborted past this size, regardless of declared Content-Length
+MAX_DOWNLOAD_SIZE = 32 * 1024 * 1024
+# images larger than this are re-encoded before being linked
+COMPRESSION_THRESHOLD = 6 * 1024 * 1024
+TARGET_SIZE = 4 * 1024 * 1024
+MAX_WIDTH = 1600
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+class EncodedImage(NamedTuple):
+    data: bytes
+    extension: str
+
+
+class DownloadTooLarge(Exception):
+    pass
+
+
+class UnsupportedContentType(Exception):
+    pass
+
+
+def is_image(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(";")[0].strip().lower().startswith("image/")
+
+
+async def download_limited(session, url: str, max_size: int = MAX_DOWNLOAD_SIZE, images_only: bool = False) -> bytes:
+    """
+    Streams response body, raising DownloadTooLarge as soon as it exceeds max_size.
+    With images_only, raises UnsupportedContentType before reading body of anything else.
+    """
+    async with session.get(url) as response:
+        response.raise_for_status()
+        if images_only and not is_image(response.content_type):
+            raise UnsupportedContentType(f"{url} is {response.content_type}")
+        if response.content_length and response.content_length > max_size:
+            raise DownloadTooLarge(f"{url} declares {response.content_length} bytes")
+        buffer = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            buffer.extend(chunk)
+            if len(buffer) > max_size:
+                raise DownloadTooLarge(f"{url} exceeded {max_size} bytes")
+    return bytes(buffer)
+
+
+def _encode(image: Image.Image, image_format: str, quality: Optional[int] = None) -> bytes:
+    result = io.BytesIO()
+    if image_format == "PNG":
+        image.save(result, format="PNG", optimize=True)
+    elif image_format == "JPEG":
+        image.convert("RGB").save(result, format="JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(result, format=image_format, quality=quality, method=4)
+    return result.getvalue()
+
+
+def _search_quality(image: Image.Image, image_format: str, target_size: int,
+                    min_quality: int = 30, max_quality: int = 90) -> Optional[bytes]:
+    """ Binary search of the highest quality that fits target size """
+    best = None
+    while min_quality <= max_quality:
+        quality = (min_quality + max_quality) // 2
+        encoded = _encode(image, image_format, quality)
+        if len(encoded) <= target_size:
+            best = encoded
+            min_quality = quality + 1
+        else:
+            max_quality = quality - 1
+    return best
+
+
+def compress_image(data: bytes, target_size: int = TARGET_SIZE, max_width: int = MAX_WIDTH) -> EncodedImage:
+    """
+    Re-encodes image to fit target size, trying lossless PNG first, then WebP and JPEG at the highest quality
+    that fits. Image is downscaled further if nothing fits. CPU heavy, meant to be run in process pool.
+    """
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    if image.width > max_width:
+        image = image.resize((max_width, image.height * max_width // image.width), Image.LANCZOS)
+
+    lossy_formats: List[str] = ["WEBP", "JPEG"] if features.check("webp") else ["JPEG"]
+    smallest = None
+    for _ in range(3):
+        encoded = _encode(image, "PNG")
+        if len(encoded) <= target_size:
+            return EncodedImage(encoded, "png")
+        for image_format in lossy_formats:
+            if encoded := _search_quality(image, image_format, target_size):
+                return EncodedImage(encoded, image_format.lower().replace("jpeg", "jpg"))
+        smallest = EncodedImage(_encode(image, lossy_formats[-1], 30), "jpg")
+        image = image.resize((image.width * 3 // 4, image.height * 3 // 4), Image.LANCZOS)
+    return smallest
+
+
+async def compress_image_async(data: bytes, target_size: int = TARGET_SIZE) -> EncodedImage:
+    global _process_pool
+    if _process_pool is None:
+        # forking would copy state of running bot (event loop, sockets, threads) into workers
+        _process_pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        return await asyncio.get_event_loop().run_in_executor(_process_pool, compress_image, data, target_size)
+    except BrokenProcessPool:
+        # worker died (killed on out of memory, for example), broken pool is replaced on next call
+        shutdown_process_pool()
+        raise
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False)
+        _process_pool = None
@@ -0,0 +1,206 @@
+import asyncio
+from time import monotonic
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aioredis.errors import ReplyError
+from loguru import logger
+
+# handler receives raw payload and may return future, resolved with True once payload is completely processed;
+# entries whose handler raises, or whose future resolves otherwise, are left pending to be retried
+_Handler = Callable[[bytes], Awaitable[Optional[asyncio.Future]]]
+
+PAYLOAD_FIELD = b"payload"
+
+
+def _next_id(entry_id: bytes) -> str:
+    """ Smallest stream id greater than given one, to continue XPENDING range after it """
+    milliseconds, sequence = entry_id.decode("utf8").split("-")
+    return f"{milliseconds}-{int(sequence) + 1}"
+
+
+def _info_field(info: dict, name: str):
+    value = info.get(name, info.get(name.encode("utf8")))
+    return value.decode("utf8") if isinstance(value, bytes) else value
+
+
+class StreamIngestor:
+    """
+    Reads messages from Redis Streams through consumer group, as durable alternative to pub/sub.
+    Entries are acknowledged only after handler processed them successfully. Anything left unacknowledged
+    by previous consumers (redeploy, crash) is claimed on start, and failed entries are retried periodically
+    until they're delivered or reach max_deliveries.
+    """
+
+    def __init__(self, redis, handlers: Dict[str, _Handler], group: str, consumer: str, batch_size: int = 100,
+                 block_ms: int = 5000, max_len: int = 100000, retry_idle_ms: int = 30000, max_deliveries: int = 5):
+        self.redis = redis
+        self.handlers = handlers
+        self.group = group
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.max_len = max_len
+        self.retry_idle_ms = retry_idle_ms
+        self.max_deliveries = max_deliveries
+
+        self.processed = 0
+        self.acknowledged = 0
+        self.failed = 0
+        self.discarded = 0
+        self._in_flight: Set[Tuple[str, bytes]] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def streams(self) -> List[str]:
+        return list(self.handlers.keys())
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.ensure_future(self._run())
+
+    @logger.catch
+    async def _run(self):
+        await self._ensure_groups()
+        for stream in self.streams:
+            await self._claim_abandoned(stream)
+            await self._remove_stale_consumers(stream)
+        # entries delivered to this consumer before, but never acknowledged (including just claimed ones)
+        for stream in self.streams:
+            await self._drain_history(stream)
+        logger.info(f"[Streams] Caught up, reading new entries of {', '.join(self.streams)}")
+
+        last_retry = monotonic()
+        while True:
+            try:
+                if monotonic() - last_retry >= self.retry_idle_ms / 1000:
+                    last_retry = monotonic()
+                    for stream in self.streams:
+                        await self._retry_failed(stream)
+                entries = await self.redis.xread_group(
+                    self.group, self.consumer, self.streams,
+                    timeout=self.block_ms, count=self.batch_size, latest_ids=[">"] * len(self.streams)
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("[Streams] Failed reading streams, retrying")
+                await asyncio.sleep(1)
+                continue
+            await self._process(entries)
+
+    async def _ensure_groups(self):
+        for stream in self.streams:
+            try:
+                await self.redis.xgroup_create(stream, self.group, latest_id="$", mkstream=True)
+                logger.info(f"[Streams] Created consumer group {self.group} for {stream}")
+            except ReplyError as error:
+                if "BUSYGROUP" not in str(error):
+                    raise
+
+    async def _pending_pages(self, stream: str, consumer: Optional[str] = None) -> AsyncIterator[list]:
+        """ Pages through pending entries list of the group (or single consumer of it) """
+        start = "-"
+        while True:
+            pending = await self.redis.xpending(stream, self.group, start, "+", self.batch_size, consumer)
+            if not pending:
+                return
+            yield pending
+            if len(pending) < self.batch_size:
+                return
+            start = _next_id(pending[-1][0])
+
+    async def _claim_abandoned(self, stream: str):
+        """ Takes over every entry pending at other consumers, they're gone by the time this one starts """
+        claimed = 0
+        async for pending in self._pending_pages(stream):
+            ids = [entry_id for entry_id, consumer, _, _ in pending if consumer.decode("utf8") != self.consumer]
+            if ids:
+                await self.redis.xclaim(stream, self.group, self.consumer, 0, *ids)
+                claimed += len(ids)
+        if claimed:
+            logger.info(f"[Streams] Claimed {claimed} pending entries of {stream}")
+
+    async def _remove_stale_consumers(self, stream: str):
+        for info in await self.redis.xinfo_consumers(stream, self.group):
+            name = _info_field(info, "name")
+            if name != self.consumer and not _info_field(info, "pending"):
+                await self.redis.xgroup_delconsumer(stream, self.group, name)
+                logger.info(f"[Streams] Removed stale consumer {name} of {stream}")
+
+    async def _retry_failed(self, stream: str):
+        """ Processes own entries again once they stay pending for a while, giving up after max_deliveries """
+        retry_ids, discard_ids = [], []
+        async for pending in self._pending_pages(stream, self.consumer):
+            for entry_id, _, idle_time, deliveries in pending:
+                if (stream, entry_id) in self._in_flight or idle_time < self.retry_idle_ms:
+                    continue
+                (discard_ids if deliveries >= self.max_deliveries else retry_ids).append(entry_id)
+        if discard_ids:
+            logger.warning(f"[Streams] Giving up on {len(discard_ids)} entries of {stream} after "
+                           f"{self.max_deliveries} deliveries: {discard_ids}")
+            await self.redis.xack(stream, self.group, *discard_ids)
+            self.discarded += len(discard_ids)
+        if retry_ids:
+            # claiming own entries resets their idle time and counts delivery
+            claimed = await self.redis.xclaim(stream, self.group, self.consumer, self.retry_idle_ms, *retry_ids)
+            await self._process([(stream, entry_id, fields) for entry_id, fields in claimed])
+
+    async def _drain_history(self, stream: str):
+        last_id = "0"
+        while True:
+            entries = await self.redis.xread_group(
+                self.group, self.consumer, [stream], timeout=None, count=self.batch_size, latest_ids=[last_id]
+            )
+            if not entries:
+                return
+            await self._process(entries)
+            last_id = entries[-1][1]
+
+    async def _process(self, entries: list):
+        dispatched: List[Tuple[str, bytes, Optional[asyncio.Future]]] = []
+        for stream, entry_id, fields in entries:
+            stream = stream.decode("utf8") if isinstance(stream, bytes) else stream
+            if (stream, entry_id) in self._in_flight:
+                continue
+            # entries deleted while pending are still listed, without fields; they're just acknowledged
+            payload = fields.get(PAYLOAD_FIELD) if fields else None
+            completion = None
+            if payload is not None:
+                try:
+                    completion = await self.handlers[stream](payload)
+                except Exception:
+                    # left pending, to be retried
+                    logger.exception(f"[Streams] Failed handling entry {entry_id} of {stream}")
+                    self.failed += 1
+                    continue
+            self._in_flight.add((stream, entry_id))
+            dispatched.append((stream, entry_id, completion))
+            self.processed += 1
+        if dispatched:
+            asyncio.ensure_future(self._acknowledge(dispatched))
+
+    @logger.catch
+    async def _acknowledge(self, dispatched: List[Tuple[str, bytes, Optional[asyncio.Future]]]):
+        results = await asyncio.gather(
+            *[completion for _, _, completion in dispatched if completion is not None], return_exceptions=True
+        )
+        outcomes = iter(results)
+        succeeded: Dict[str, List[bytes]] = {}
+        try:
+            for stream, entry_id, completion in dispatched:
+                # completions resolve to False (or exception) when delivery failed
+                if completion is None or next(outcomes) is True:
+                    succeeded.setdefault(stream, []).append(entry_id)
+                else:
+                    self.failed += 1
+            for stream, ids in succeeded.items():
+                await self.redis.xack(stream, self.group, *ids)
+                await self.redis.xtrim(stream, self.max_len, exact_len=False)
+                self.acknowledged += len(ids)
+        finally:
+            for stream, entry_id, _ in dispatched:
+                self._in_flight.discard((stream, entry_id))
+
+    def describe(self) -> str:
+        return f"**Streams** ({', '.join(self.streams)}): {self.processed} processed, " \
+               f"{self.acknowledged} acknowledged, {self.failed} failed, {self.discarded} discarded"
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from typing import Callable, Iterable, List, Optional
+
+from aiohttp import ClientSession
+from loguru import logger
+
+from .constants import ISSUE_MIRROR_PATH
+from .enums import RequestPriority
+from .github_integration import github_api_request_page
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    repo TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    body TEXT,
+    labels TEXT,
+    state TEXT NOT NULL,
+    is_pull_request INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (repo, number)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS issues_fts USING fts5(
+    title, body, labels, content='issues', content_rowid='rowid'
+);
+
+CREATE TRIGGER IF NOT EXISTS issues_after_insert AFTER INSERT ON issues BEGIN
+    INSERT INTO issues_fts(rowid, title, body, labels) VALUES (new.rowid, new.title, new.body, new.labels);
+END;
+
+CREATE TRIGGER IF NOT EXISTS issues_after_delete AFTER DELETE ON issues BEGIN
+    INSERT INTO issues_fts(issues_fts, rowid, title, body, labels)
+    VALUES ('delete', old.rowid, old.title, old.body, old.labels);
+END;
+
+CREATE TRIGGER IF NOT EXISTS issues_after_update AFTER UPDATE ON issues BEGIN
+    INSERT INTO issues_fts(issues_fts, rowid, title, body, labels)
+    VALUES ('delete', old.rowid, old.title, old.body, old.labels);
+    INSERT INTO issues_fts(rowid, title, body, labels) VALUES (new.rowid, new.title, new.body, new.labels);
+END;
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    repo TEXT PRIMARY KEY,
+    last_updated_at TEXT NOT NULL
+);
+"""
+
+_UPSERT = """
+INSERT INTO issues (repo, number, title, body, labels, state, is_pull_request, updated_at, data)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (repo, number) DO UPDATE SET
+    title = excluded.title, body = excluded.body, labels = excluded.labels, state = excluded.state,
+    is_pull_request = excluded.is_pull_request, updated_at = excluded.updated_at, data = excluded.data
+"""
+
+
+class IssueMirror:
+    """
+    Local SQLite copy of issues and pull requests of preset repositories, with FTS5 full-text index
+    over titles, bodies and labels. Kept up to date incrementally, using `since` filter of issues listing.
+    All database work runs on a dedicated thread, off the event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="issue-mirror")
+        self._connection: Optional[sqlite3.Connection] = None
+        self.stored_issues = 0
+        self.last_sync: Optional[float] = None
+
+    async def _run(self, function: Callable, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, function, *args)
+
+    def _db(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if directory := os.path.dirname(self.path):
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(_SCHEMA)
+        return self._connection
+
+    def _get_cursor(self, repo: str) -> Optional[str]:
+        row = self._db().execute("SELECT last_updated_at FROM sync_state WHERE repo = ?", (repo,)).fetchone()
+        return row["last_updated_at"] if row else None
+
+    def _store_page(self, repo: str, issues: List[dict]):
+        with self._db() as db:
+            db.executemany(_UPSERT, [
+                (
+                    repo, issue["number"], issue["title"], issue["body"] or "",
+                    " ".join(label["name"] for label in issue["labels"]), issue["state"],
+                    int("pull_request" in issue), issue["updated_at"], json.dumps(issue),
+                )
+                for issue in issues
+            ])
+            last_updated_at = max(issue["updated_at"] for issue in issues)
+            db.execute(
+                "INSERT INTO sync_state (repo, last_updated_at) VALUES (?, ?) "
+                "ON CONFLICT (repo) DO UPDATE SET last_updated_at = max(last_updated_at, excluded.last_updated_at)",
+                (repo, last_updated_at)
+            )
+        self.stored_issues = self._count()
+
+    async def sync(self, session: ClientSession, repos: Iterable[str], per_page: int = 100) -> int:
+        """ Fetches issues updated since last sync, page by page. Returns amount of stored issues """
+        stored = 0
+        for repo in repos:
+            since = await self._run(self._get_cursor, repo)
+            next_path = f"/repos/arcadia-redux/{repo}/issues?state=all&sort=updated&direction=asc&per_page={per_page}"
+            if since:
+                next_path += f"&since={since}"
+            while next_path:
+                status, issues, next_path = await github_api_request_page(
+                    session, next_path, RequestPriority.BULK
+                )
+                if not status:
+                    logger.warning(f"[Issue mirror] Failed syncing {repo}: {issues}")
+                    break
+                if issues:
+                    await self._run(self._store_page, repo, issues)
+                    stored += len(issues)
+        self.last_sync = time()
+        return stored
+
+    @staticmethod
+    def _match_expression(query: str) -> str:
+        """ Every word must be present, last one may be incomplete """
+        words = [word.replace('"', '""') for word in query.split()]
+        terms = [f'"{word}"' for word in words]
+        if terms:
+            terms[-1] += "*"
+        return " ".join(terms)
+
+    def _search(self, query: str, repo: Optional[str], limit: int) -> List[dict]:
+        expression = self._match_expression(query)
+        if not expression:
+            return []
+        sql = "SELECT issues.data FROM issues_fts JOIN issues ON issues.rowid = issues_fts.rowid " \
+              "WHERE issues_fts MATCH ?"
+        params = [expression]
+        if repo:
+            sql += " AND issues.repo = ?"
+            params.append(repo)
+        sql += " ORDER BY bm25(issues_fts, 10.0, 1.0, 5.0) LIMIT ?"
+        params.append(limit)
+        return [json.loads(row["data"]) for row in self._db().execute(sql, params)]
+
+    async def search(self, query: str, repo: Optional[str] = None, limit: int = 10) -> List[dict]:
+        """ Best matching issues (as stored REST responses), titles weighted above labels and bodies """
+        return await self._run(self._search, query, repo, limit)
+
+    def _count(self) -> int:
+        return self._db().execute("SELECT count(*) FROM issues").fetchone()[0]
+
+    def describe(self) -> str:
+        synced = f"last synced {time() - self.last_sync:.0f}s ago" if self.last_sync else "not synced yet"
+        return f"**Issue mirror**: {self.stored_issues} issues stored at `{self.path}`, {synced}"
+
+
+issue_mirror = IssueMirror(ISSUE_MIRROR_PATH)
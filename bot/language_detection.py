@@ -0,0 +1,81 @@
+"""
+Offline detection of plain English text, used to skip translation API calls for messages that don't need it.
+Deliberately one-sided: it can only tell that text is most likely English, anything else is left for Google.
+"""
+import re
+from typing import FrozenSet
+
+_WORD_REGEX = re.compile(r"[a-z']+")
+_LETTER_REGEX = re.compile(r"[^\W\d_]")
+
+# most frequent english words, plus common in-game chat vocabulary
+ENGLISH_WORDS: FrozenSet[str] = frozenset("""
+a about after again against all almost also always am an and any anyone are around as at away back bad be because
+been before being best better big both but by came can can't cant come could day did didn't do does doesn't doing
+don't done dont down each even ever every few find first for from game games get gets getting give go going good
+got great had has have having he her here him his how i i'd i'll i'm i've if im in into is isn't it it's its just
+keep know last let like little long look lot lots made make many match maybe me mean more most much must my need
+never new next no not nothing now of off ok okay on once one only or other our out over people play played player
+players playing please pls plz really right said same say see should since so some someone something still such
+sure take than thank thanks thx that that's the their them then there these they thing things think this those
+though time to too try two up us use used very want was way we well were what when where which while who why will
+win with won't would wrong yeah yes yet you you're your
+gg wp ggwp ez lol lmao afk lag laggy noob nub team teammate teammates feed feeder feeding report bug bugs fix
+fixed hero heroes item items skill skills spell spells ult ulti mid top bot lane gold xp level kill kills died
+dead die mmr rank ranked server servers ping fps glhf gl hf rip pog op nerf buff broken spam bro dude guys pick
+ban banned leave left quit stupid idiot trash enemy enemies ally allies push tower towers creep creeps ward
+wards carry support tank damage hello hi hey everyone everybody anybody nobody
+""".split())
+
+# short words frequent in other latin-script languages players write in
+FOREIGN_WORDS: FrozenSet[str] = frozenset("""
+que de la el los las por para con una uno pero como mas muy esto eso esta hay tengo porque nao não voce você
+vc eu meu minha ele ela isso aqui tem sim obrigado jogo time kkk kkkk kkkkk und der die das ist nicht ich du
+ein eine mit auch aber noch bitte danke le les des est pas je tu il elle avec pour mais oui merci jest nie sie
+tak bardzo ve bir bu ne da ama cok çok ja nu privet da net blyat davai che kak eto
+""".split())
+
+# most frequent english character trigrams
+ENGLISH_TRIGRAMS: FrozenSet[str] = frozenset("""
+the and ing ion tio ent ati for her ter hat tha ere ate his con res ver all ons nce men ith ted ers pro thi wit
+are ess not ive was ect rea com eve per int est sta cti ica ist ear ain one our iti rat ell ant str nte tin hin
+ome oul uld ord thr ght igh hav ery out pla lay aye yer ame gam tea eam use ich whi hic ong ake ike now kno fee
+eed ill wil ine ost can ans ked ack bac ood goo hou ust jus ink tim ime lit ple rep epo por ort nee ull oth wha
+eal any man sto top hen whe fro rom ene emy sho how ble ers ies
+""".split())
+
+
+def _trigrams(word: str):
+    return (word[i:i + 3] for i in range(len(word) - 2))
+
+
+def english_confidence(text: str) -> float:
+    """
+    Returns confidence in range [0, 1] that text is written in English.
+    Text without any letters (numbers, emoticons) counts as English, since there's nothing to translate.
+    """
+    letters = _LETTER_REGEX.findall(text)
+    if not letters:
+        return 1.0
+    if not all(letter.isascii() for letter in letters):
+        # non-latin scripts and diacritics both mean some other language
+        return 0.0
+
+    words = _WORD_REGEX.findall(text.lower())
+    if not words:
+        return 1.0
+
+    known = sum(1 for word in words if word in ENGLISH_WORDS)
+    foreign = sum(1 for word in words if word in FOREIGN_WORDS and word not in ENGLISH_WORDS)
+    if foreign * 2 >= len(words) or foreign >= 2:
+        return 0.0
+
+    long_words = [word for word in words if len(word) >= 3 and word not in ENGLISH_WORDS]
+    if long_words:
+        trigrams = [trigram for word in long_words for trigram in _trigrams(word)]
+        trigram_score = sum(1 for trigram in trigrams if trigram in ENGLISH_TRIGRAMS) / len(trigrams)
+    else:
+        trigram_score = 1.0
+
+    confidence = 0.6 * known / len(words) + 0.4 * trigram_score - foreign / len(words)
+    return max(0.0, min(1.0, confidence))
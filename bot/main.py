@@ -1,10 +1,8 @@
 import asyncio
 import datetime
-import json
 import os
-from typing import Final
+from typing import Final, Optional, Tuple, List
 
-import aiohttp
 import aioredis
 import discord
 from aioredis.pubsub import Receiver
@@ -13,9 +11,25 @@ from discord.ext import commands, tasks
 from loguru import logger
 
 from .cogs import github_cog, core_cog, scheduling_cog
-from .constants import CUSTOM_GAMES
+from .chat_queue import ChatQueue
+from .constants import CUSTOM_GAMES, SUGGESTION_WORKERS, SUGGESTION_QUEUE_SIZE
+from .constants import CHAT_QUEUE_SIZE, CHAT_QUEUE_SUMMARIZE_OVERFLOW, CHAT_RELAY_ATTEMPTS
+from .constants import INGESTION_MODE, SUGGESTIONS_STREAM, CHAT_STREAM, STREAM_GROUP, STREAM_CONSUMER, STREAM_MAX_LEN
+from .constants import GITHUB_CACHE_IN_REDIS
 from .constants import LOCALS_IMPORTED, SERVER_LINKS  # True if imported local .env file
 from .enums import BotState
+from .game_backends import GameBackends
+from .github_cache import response_cache
+from .github_integration import repo_metadata
+from .github_scheduler import github_scheduler
+from .http_pools import HttpPools
+from .image_processing import shutdown_process_pool
+from .ingestion import StreamIngestor
+from .issue_mirror import issue_mirror
+from .payloads import SuggestionPayload, ChatPayload, decode_suggestion, decode_chat_message
+from .pipeline import OrderedPipeline
+from .steam import SteamProfileResolver
+from . import markdown, translator
 from .translator import translate_single, translate
 from .views.generic import URLView
 
@@ -31,8 +45,19 @@ intents.webhooks = False
 intents.members = True
 intents.message_content = True
 
-bot = commands.Bot(command_prefix=PREFIX, intents=intents)
-bot.session = aiohttp.ClientSession()
+
+class Bot(commands.Bot):
+    async def close(self):
+        # run() closes bot on any shutdown, while its event loop is still running
+        try:
+            await super().close()
+        finally:
+            await self.session.close()
+
+
+bot = Bot(command_prefix=PREFIX, intents=intents)
+bot.session = HttpPools()
+bot.game_backends = GameBackends(bot.session)
 bot.running_local = LOCALS_IMPORTED
 bot.add_cog(github_cog.Github(bot), override=True)
 bot.add_cog(scheduling_cog.SchedulingCog(bot), override=True)
@@ -40,8 +65,11 @@ bot.add_cog(core_cog.Core(bot), override=True)
 
 bot.report_channels = CUSTOM_GAMES.copy()
 bot.chat_channels = CUSTOM_GAMES.copy()
-bot.queued_chat_messages = CUSTOM_GAMES.copy()
+bot.queued_chat_messages = {}
 bot.translation_channel = None
+bot.suggestions_pipeline = None
+bot.steam_profiles = None
+bot.ingestor = None
 
 webapi_key = os.getenv("WEBAPI_KEY")
 
@@ -80,20 +108,39 @@ async def on_ready():
             logger.info(f"[{custom_game}] Assigned chat channel: {ch_id}:{name}")
             bot.chat_channels[custom_game] = bot.get_channel(int(ch_id))
 
-    receiver = Receiver()
-
-    @logger.catch
-    async def reader(channel):
-        async for ch, message in channel.iter():
-            if ch.name == b'suggestions:*':
-                await send_suggestion(message[1])
-            elif ch.name == b'chat:*':
-                await queue_chat_message(message[1])
-        logger.info("finished reading!")
-
-    bot.task = asyncio.ensure_future(reader(receiver))
-    await bot.redis.psubscribe(receiver.pattern('suggestions:*'))
-    await bot.redis.psubscribe(receiver.pattern('chat:*'))
+    translator.attach_redis(bot.redis)
+    if GITHUB_CACHE_IN_REDIS:
+        response_cache.attach_redis(bot.redis)
+    bot.steam_profiles = SteamProfileResolver(bot.session, bot.redis, webapi_key)
+    bot.suggestions_pipeline = OrderedPipeline(
+        "Suggestions", prepare_suggestion, deliver_suggestion, SUGGESTION_WORKERS, SUGGESTION_QUEUE_SIZE
+    )
+    bot.suggestions_pipeline.start()
+
+    if INGESTION_MODE == "streams":
+        bot.ingestor = StreamIngestor(bot.redis, {
+            SUGGESTIONS_STREAM: send_suggestion,
+            CHAT_STREAM: queue_chat_message,
+        }, STREAM_GROUP, STREAM_CONSUMER, max_len=STREAM_MAX_LEN)
+        bot.ingestor.start()
+    else:
+        receiver = Receiver()
+
+        @logger.catch
+        async def reader(channel):
+            async for ch, message in channel.iter():
+                try:
+                    if ch.name == b'suggestions:*':
+                        await send_suggestion(message[1])
+                    elif ch.name == b'chat:*':
+                        await queue_chat_message(message[1])
+                except Exception:
+                    logger.exception(f"Failed handling message of {ch.name}")
+            logger.info("finished reading!")
+
+        bot.task = asyncio.ensure_future(reader(receiver))
+        await bot.redis.psubscribe(receiver.pattern('suggestions:*'))
+        await bot.redis.psubscribe(receiver.pattern('chat:*'))
 
     send_queued_chat_messages.start()
     __BOT_STATE = BotState.SET
@@ -105,15 +152,46 @@ async def state(ctx):
     await ctx.send(__BOT_STATE)
 
 
-@logger.catch
-async def send_suggestion(message: bytes):
-    decoded = json.loads(message)
-    custom_game = decoded["custom_game"]
-    steam_id = decoded["steam_id"]
-    text = decoded["text"].strip()
+@bot.command()
+async def stats(ctx):
+    sections = []
+    if bot.suggestions_pipeline:
+        sections.append(bot.suggestions_pipeline.describe())
+    if bot.steam_profiles:
+        sections.append(bot.steam_profiles.describe())
+    if bot.ingestor:
+        sections.append(bot.ingestor.describe())
+    sections.append(translator.describe())
+    sections.append(response_cache.describe())
+    sections.append(github_scheduler.describe())
+    sections.append(repo_metadata.describe())
+    sections.append(issue_mirror.describe())
+    sections.append(markdown.describe())
+    sections.append(bot.session.describe())
+    sections.append(bot.game_backends.describe())
+    await ctx.send("\n\n".join(sections) or "Nothing to report yet.")
+
+
+async def send_suggestion(message: bytes) -> Optional[asyncio.Future]:
+    """
+    Hands raw suggestion payload over to the pipeline, waiting only if its queue is full.
+    Returns future resolved with delivery result, None for payloads that can't be decoded.
+    """
+    suggestion = decode_suggestion(message)
+    if not suggestion:
+        return None
+    return await bot.suggestions_pipeline.put(suggestion.custom_game, suggestion)
+
+
+async def prepare_suggestion(
+        suggestion: SuggestionPayload
+) -> Optional[Tuple[discord.TextChannel, discord.Embed, URLView]]:
+    custom_game = suggestion.custom_game
+    steam_id = suggestion.steam_id
+    text = suggestion.text.strip()
     if len(text) < 3:
         return
-    supporter_level = decoded.get("supporter_level", -1)
+    supporter_level = suggestion.supporter_level
 
     logger.info(f"Message from channel {custom_game} by {steam_id}: {text}")
 
@@ -123,16 +201,10 @@ async def send_suggestion(message: bytes):
     if not report_channel:
         return
 
-    resp = await bot.session.get(
-        f"http://api.steampowered.com/ISteamUser/GetPlayerSummaries/v0002/?key={webapi_key}&steamids={steam_id}"
-    )
-    steam_profile_data = None
-    if resp.status == 200:
-        steam_profile_data = await resp.json()
+    steam_profile_data = await bot.steam_profiles.resolve(steam_id)
 
     profile_avatar_link, profile_name = None, None
     if steam_profile_data:
-        steam_profile_data = steam_profile_data["response"]["players"][0]
         profile_avatar_link = steam_profile_data["avatarmedium"]
         profile_name = steam_profile_data["personaname"]
 
@@ -151,18 +223,38 @@ async def send_suggestion(message: bytes):
     view = URLView()
     backend_url = SERVER_LINKS.get(custom_game)
     view.add_url("Player Profile", f"{backend_url}/players/{steam_id}")
-    if match_id := decoded.get("match_id", None):
+    if match_id := suggestion.match_id:
         view.add_url("Match", f"{backend_url}/matches/details/{match_id}")
 
+    return report_channel, embed, view
+
+
+async def deliver_suggestion(prepared: Tuple[discord.TextChannel, discord.Embed, URLView]):
+    report_channel, embed, view = prepared
     await report_channel.send(embed=embed, allowed_mentions=AllowedMentions.none(), view=view)
 
 
-async def queue_chat_message(message: bytes):
-    decoded = json.loads(message)
-    custom_game = decoded["custom_game"]
+async def queue_chat_message(message: bytes) -> Optional[asyncio.Future]:
+    """
+    Queues chat message for the next relay of its game.
+    Returns future resolved with relay result, None for payloads that can't be decoded.
+    """
+    chat_message = decode_chat_message(message)
+    if not chat_message:
+        return None
+    custom_game = chat_message.custom_game
     if custom_game not in bot.queued_chat_messages:
-        bot.queued_chat_messages[custom_game] = []
-    bot.queued_chat_messages[custom_game].append(decoded)
+        bot.queued_chat_messages[custom_game] = ChatQueue(
+            custom_game, CHAT_QUEUE_SIZE, summarize_overflow=CHAT_QUEUE_SUMMARIZE_OVERFLOW,
+            max_attempts=CHAT_RELAY_ATTEMPTS
+        )
+    queue = bot.queued_chat_messages[custom_game]
+    relayed = asyncio.get_event_loop().create_future()
+    # enough text for a full Discord message, no reason to wait for next timed flush
+    if queue.push(chat_message, relayed) and not queue.flush_scheduled:
+        queue.flush_scheduled = True
+        asyncio.ensure_future(flush_chat_queue(custom_game))
+    return relayed
 
 
 @bot.event
@@ -202,18 +294,17 @@ async def on_message(message: discord.Message):
                 if detected_language != "en" and translated_text != message_text:
                     await message.reply(f"[TL: {detected_language} => en] {translated_text}", mention_author=False)
 
-            backend_link = SERVER_LINKS.get(custom_game, None)
-            if not backend_link:
+            backend = bot.game_backends.get(custom_game)
+            if not backend:
                 continue
             # process chat message sending
-            # backend_link = "http://127.0.0.1:5000/"
-            resp = await bot.session.post(f"{backend_link}/api/lua/match/send_dev_chat_message", json={
+            response = await backend.post("/api/lua/match/send_dev_chat_message", {
                 "steamId": -1,
                 "customGame": custom_game,
                 "steamName": message.author.name,
                 "text": message_text
             })
-            if resp.status >= 400:
+            if not response.ok:
                 await message.add_reaction("🚫")
             return
 
@@ -237,43 +328,82 @@ async def on_command_error(context, err):
 
 @tasks.loop(seconds=10, reconnect=True)
 async def send_queued_chat_messages():
-    for custom_game, queue in bot.queued_chat_messages.items():
-        if queue and len(queue) > 0:
-            current_msg_len = 0
+    await asyncio.gather(*[
+        flush_chat_queue(custom_game) for custom_game in list(bot.queued_chat_messages.keys())
+    ])
+
+
+async def flush_chat_queue(custom_game: str):
+    """
+    Relays queued chat messages of a single game. Errors are contained within the game,
+    and messages that weren't sent are put back into queue for the next flush.
+    """
+    queue = bot.queued_chat_messages[custom_game]
+    async with queue.lock:
+        queue.flush_scheduled = False
+        if not queue:
+            return
+        queue_messages, dropped = queue.drain()
 
-            channel = bot.chat_channels.get(custom_game, None)
-            if not channel:
-                continue
+        channel = bot.chat_channels.get(custom_game, None)
+        if not channel:
+            # nowhere to relay chat of this game, like suggestions without report channel
+            queue.complete(queue_messages)
+            return
 
+        sent_count = 0
+        try:
+            for chunk, chunk_end in await build_chat_relay_chunks(queue, queue_messages, dropped):
+                await channel.send(chunk)
+                queue.complete(queue_messages[sent_count:chunk_end])
+                sent_count, dropped = chunk_end, 0
+        except Exception:
+            logger.exception(f"[{custom_game}] Failed relaying chat, {len(queue_messages) - sent_count} "
+                             f"messages kept for next flush")
+            queue.restore(queue_messages[sent_count:], dropped)
+
+
+async def build_chat_relay_chunks(
+        queue: ChatQueue, queue_messages: List[ChatPayload], dropped: int
+) -> List[Tuple[str, int]]:
+    """ Returns Discord messages to send, each paired with amount of queued messages relayed up to it """
+    chunks = []
+    current_msg_len = 0
+    compound_message = []
+    if overflow_notice := queue.overflow_notice(dropped):
+        compound_message.append(overflow_notice)
+
+    messages_content = [message.text for message in queue_messages]
+    translated = await translate(messages_content)
+
+    for i, message in enumerate(queue_messages):
+        translation = translated[i]
+        if translation.detected_language_code != "en":
+            translated_text = f"(TL [**{translation.detected_language_code}**]: {translation.translated_text})"
+        else:
+            translated_text = ""
+        supporter_level = message.supporter_level
+        if not message.anon:
+            m_name = f"**<{message.name} {{{supporter_level}}}>**"
+        else:
+            m_name = f"*<{message.name} {{{supporter_level}}}>*"
+
+        message_time = message.time if type(message.time) == str else f"<t:{int(message.time)}:R>"
+        built_string = f"{message_time} [{int(message.steam_id) - 76561197960265728}] {m_name} **:** " \
+                       f"{message.text} \t {translated_text}"
+        current_msg_len += len(built_string)
+        compound_message.append(built_string)
+
+        if current_msg_len >= 1800:  # actual message length limit is ~2048, but just to be sure
+            chunks.append(("\n".join(compound_message), i + 1))
             compound_message = []
+            current_msg_len = 0
+    if compound_message:
+        chunks.append(("\n".join(compound_message), len(queue_messages)))
+    return chunks
+
 
-            messages_content = [message["text"] for message in queue]
-            translated = await translate(messages_content)
-
-            for i, message in enumerate(queue):
-                translation = translated[i]
-                if translation.detected_language_code != "en":
-                    translated_text = f"(TL [**{translation.detected_language_code}**]: {translation.translated_text})"
-                else:
-                    translated_text = ""
-                supporter_level = message.get("supporter_level", -1)
-                if not message.get("anon", False):
-                    m_name = f"**<{message['name']} {{{supporter_level}}}>**"
-                else:
-                    m_name = f"*<{message['name']} {{{supporter_level}}}>*"
-
-                message_time = message['time'] if type(message['time']) == str else f"<t:{int(message['time'])}:R>"
-                built_string = f"{message_time} [{int(message['steam_id']) - 76561197960265728}] {m_name} **:** " \
-                               f"{message['text']} \t {translated_text}"
-                current_msg_len += len(built_string)
-                compound_message.append(built_string)
-
-                if current_msg_len >= 1800:  # actual message length limit is ~2048, but just to be sure
-                    await channel.send("\n".join(compound_message))
-                    compound_message = []
-                    current_msg_len = 0
-            await channel.send("\n".join(compound_message))
-        bot.queued_chat_messages[custom_game] = []
-
-
-bot.run(token)
\ No newline at end of file
+try:
+    bot.run(token)
+finally:
+    shutdown_process_pool()
\ No newline at end of file
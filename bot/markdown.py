@@ -0,0 +1,122 @@
+import hashlib
+import re
+from typing import Dict, Iterator, List, Match, NamedTuple, Optional, Tuple
+
+from aiohttp import ClientSession
+
+from .cache import TTLCache
+from .github_graphql import IssueReference, get_issue_references
+
+# everything converted for Discord, matched in single scan of the body
+# code is matched only to be left untouched
+_token_regex = re.compile(
+    r"(?P<code>```[\s\S]*?```|`[^`\n]+`)"
+    r"|(?P<image>!\[(?P<image_alt>[^\]\n]*)\]\((?P<image_url>[^)\s]+)[^)]*\))"
+    r"|(?P<html_image><img\b[^>]*?\bsrc=\"(?P<html_image_url>[^\"]+)\"[^>]*>)"
+    r"|(?P<task>[-*] \[(?P<task_state>[ xX])\])"
+    r"|^(?P<header>#{1,6}[ \t]+(?P<header_text>[^\n]*?))[ \t#]*$"
+    r"|(?P<link>https?://(?:[\w-]+\.)?github\.com/arcadia-redux/(?P<link_repo>[\w.-]+)/(?:issues|pull)/"
+    r"(?P<link_number>\d+))"
+    r"|(?P<number> #(?P<number_value>\d+))",
+    re.MULTILINE
+)
+
+# references keep their open / closed state, so rendered text can't be kept forever
+markdown_cache = TTLCache(max_size=1024, ttl=10 * 60)
+
+
+class RenderedMarkdown(NamedTuple):
+    text: str
+    image_link: str
+
+
+def _reference_of(token: Match, repo_name: str) -> IssueReference:
+    if token.group("link"):
+        return token.group("link_repo"), int(token.group("link_number"))
+    return repo_name, int(token.group("number_value"))
+
+
+def _render_token(token: Match, repo_name: str, resolved: Dict[IssueReference, dict]) -> str:
+    kind = token.lastgroup
+    if kind == "task":
+        return "☐" if token.group("task_state") == " " else "✅"
+    if kind == "header":
+        return f"**{token.group('header_text')}**"
+    if kind == "image":
+        return f"[{token.group('image_alt') or 'Image'}]({token.group('image_url')})"
+    if kind == "html_image":
+        return f"[Image]({token.group('html_image_url')})"
+    if kind in ("link", "number"):
+        issue_data = resolved.get(_reference_of(token, repo_name), None)
+        if not issue_data:
+            return token.group(0)
+        issue_state = "🟢" if issue_data['state'] == "open" else "🔴"
+        if kind == "link":
+            return f"{issue_state} [#{issue_data['number']} {issue_data['title']}]({token.group('link')})"
+        return f" {issue_state} [{token.group(0)} {issue_data['title']}]({issue_data['html_url']})"
+    return token.group(0)
+
+
+def _assemble(text: str, tokens: List[Match], repo_name: str, resolved: Dict[IssueReference, dict],
+              extract_image: bool, limit: Optional[int]) -> RenderedMarkdown:
+    image_link = ""
+
+    def _pieces() -> Iterator[Tuple[str, bool]]:
+        """ Yields converted text piece by piece, with flag whether piece can be cut in the middle """
+        nonlocal image_link
+        position = 0
+        for token in tokens:
+            yield text[position:token.start()], True
+            image_url = token.group("image_url") or token.group("html_image_url")
+            if extract_image and image_url and not image_link:
+                image_link = image_url
+                yield "[On Thumbnail]", False
+            else:
+                yield _render_token(token, repo_name, resolved), False
+            position = token.end()
+        yield text[position:], True
+
+    parts = []
+    length = 0
+    for piece, splittable in _pieces():
+        if limit is not None and length + len(piece) > limit:
+            if splittable:
+                parts.append(piece[:limit - length])
+            parts.append(" ...")
+            break
+        parts.append(piece)
+        length += len(piece)
+    return RenderedMarkdown("".join(parts), image_link)
+
+
+async def render_markdown(session: ClientSession, text: str, repo_name: str, extract_image: bool = False,
+                          limit: Optional[int] = None) -> RenderedMarkdown:
+    """
+    Converts GitHub markdown into Discord embed text: resolves issue references, converts task lists,
+    headers and images (first one is taken out as embed image if extract_image is set),
+    and truncates result to limit. Results are memoized by body hash.
+    """
+    key = (hashlib.sha1(text.encode("utf8")).hexdigest(), repo_name, extract_image, limit)
+    if (cached := markdown_cache.get(key)) is not None:
+        return cached
+
+    tokens = list(_token_regex.finditer(text))
+    # all referenced issues are collected first, and resolved at once
+    references = [_reference_of(token, repo_name) for token in tokens if token.lastgroup in ("link", "number")]
+    resolved = await get_issue_references(session, references) if references else {}
+
+    rendered = _assemble(text, tokens, repo_name, resolved, extract_image, limit)
+    markdown_cache.set(key, rendered)
+    return rendered
+
+
+def extract_image_link(text: str) -> Tuple[str, str]:
+    """ Takes out first image of the text, without converting anything else """
+    for token in _token_regex.finditer(text):
+        if image_url := token.group("image_url") or token.group("html_image_url"):
+            return image_url, f"{text[:token.start()]}[On Thumbnail]{text[token.end():]}"
+    return "", text
+
+
+def describe() -> str:
+    return f"**Markdown renders**: {markdown_cache.describe()}"
@@ -0,0 +1,42 @@
+from typing import Optional, Union
+
+import msgspec
+from loguru import logger
+
+
+class SuggestionPayload(msgspec.Struct, gc=False):
+    custom_game: str
+    steam_id: Union[int, str]
+    text: str
+    supporter_level: int = -1
+    match_id: Optional[Union[int, str]] = None
+
+
+class ChatPayload(msgspec.Struct, gc=False):
+    custom_game: str
+    steam_id: Union[int, str]
+    name: str
+    text: str
+    time: Union[float, str]
+    supporter_level: int = -1
+    anon: bool = False
+
+
+_suggestion_decoder = msgspec.json.Decoder(SuggestionPayload)
+_chat_decoder = msgspec.json.Decoder(ChatPayload)
+
+
+def decode_suggestion(raw: bytes) -> Optional[SuggestionPayload]:
+    try:
+        return _suggestion_decoder.decode(raw)
+    except msgspec.DecodeError as error:
+        logger.warning(f"[Payload] Dropped malformed suggestion: {error}\n{raw[:200]!r}")
+        return None
+
+
+def decode_chat_message(raw: bytes) -> Optional[ChatPayload]:
+    try:
+        return _chat_decoder.decode(raw)
+    except msgspec.DecodeError as error:
+        logger.warning(f"[Payload] Dropped malformed chat message: {error}\n{raw[:200]!r}")
+        return None
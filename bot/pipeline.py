@@ -0,0 +1,143 @@
+import asyncio
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from loguru import logger
+
+_Prepare = Callable[[Any], Awaitable[Any]]
+_Deliver = Callable[[Any], Awaitable[None]]
+
+
+class StageStats:
+    """ Running latency figures of a single pipeline stage, in seconds """
+    __slots__ = ("count", "total", "max", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, elapsed: float):
+        self.count += 1
+        self.total += elapsed
+        self.last = elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def __str__(self):
+        return f"avg {self.average * 1000:.0f}ms | max {self.max * 1000:.0f}ms | last {self.last * 1000:.0f}ms " \
+               f"({self.count} total)"
+
+
+class _PipelineItem:
+    __slots__ = ("key", "payload", "enqueued_at", "previous", "done")
+
+    def __init__(self, key: Hashable, payload: Any, previous: Optional[asyncio.Future], done: asyncio.Future):
+        self.key = key
+        self.payload = payload
+        self.enqueued_at = perf_counter()
+        self.previous = previous
+        self.done = done
+
+
+class OrderedPipeline:
+    """
+    Bounded queue drained by a pool of workers.
+    `prepare` runs concurrently for any number of items, while `deliver` is called in submission order for items
+    sharing the same key, so the slow part of processing never reorders output of a single source.
+    `put` waits while the queue is full, applying backpressure to the producer.
+    """
+
+    def __init__(self, name: str, prepare: _Prepare, deliver: _Deliver, workers: int = 4, max_size: int = 1000):
+        self.name = name
+        self.prepare = prepare
+        self.deliver = deliver
+        self.workers_count = max(1, workers)
+
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.stats: Dict[str, StageStats] = {
+            "queued": StageStats(),
+            "prepare": StageStats(),
+            "deliver": StageStats(),
+        }
+        self.failed = 0
+
+        self._tails: Dict[Hashable, asyncio.Future] = {}
+        self._workers: List[asyncio.Task] = []
+
+    def start(self):
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.ensure_future(self._worker(i)) for i in range(self.workers_count)
+        ]
+        logger.info(f"[{self.name}] Started {self.workers_count} workers")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    async def put(self, key: Hashable, payload: Any) -> asyncio.Future:
+        """
+        Enqueue payload, waiting for free space if needed.
+        Returns future that resolves with True once payload was delivered (or deliberately skipped by `prepare`),
+        and with False if processing failed.
+        """
+        done = asyncio.get_event_loop().create_future()
+        previous = self._tails.get(key)
+        self._tails[key] = done
+        await self.queue.put(_PipelineItem(key, payload, previous, done))
+        return done
+
+    async def _worker(self, index: int):
+        while True:
+            item = await self.queue.get()
+            delivered = False
+            try:
+                await self._process(item)
+                delivered = True
+            except Exception:
+                self.failed += 1
+                logger.exception(f"[{self.name}] worker {index} failed processing item of {item.key}")
+            finally:
+                if not item.done.done():
+                    item.done.set_result(delivered)
+                if self._tails.get(item.key) is item.done:
+                    del self._tails[item.key]
+                self.queue.task_done()
+
+    async def _process(self, item: _PipelineItem):
+        started_at = perf_counter()
+        self.stats["queued"].record(started_at - item.enqueued_at)
+
+        prepared = await self.prepare(item.payload)
+        prepared_at = perf_counter()
+        self.stats["prepare"].record(prepared_at - started_at)
+
+        # previous item of the same key is always picked up by some worker before this one,
+        # so waiting on it here can't deadlock the pool
+        if item.previous:
+            await asyncio.shield(item.previous)
+        if prepared is None:
+            return
+
+        deliver_started_at = perf_counter()
+        await self.deliver(prepared)
+        self.stats["deliver"].record(perf_counter() - deliver_started_at)
+
+    def describe(self) -> str:
+        lines = [f"**{self.name}**: depth {self.depth}/{self.queue.maxsize}, "
+                 f"{self.workers_count} workers, {self.failed} failed"]
+        lines.extend(f"`{stage}`: {stats}" for stage, stats in self.stats.items())
+        return "\n".join(lines)
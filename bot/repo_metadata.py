@@ -0,0 +1,45 @@
+import asyncio
+from copy import deepcopy
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from .cache import TTLCache
+from .constants import ApiResponse
+
+MetadataKey = Tuple[str, str]  # (repo, kind)
+
+
+class RepoMetadataCache:
+    """
+    Per-repo cache of rarely changing lists (labels, milestones, team members).
+    Concurrent misses of the same key share single load, callers always receive their own copy of data.
+    """
+
+    def __init__(self, ttl: float = 15 * 60):
+        self.cache = TTLCache(max_size=256, ttl=ttl)
+        self._locks: Dict[MetadataKey, asyncio.Lock] = {}
+
+    async def get(self, key: MetadataKey, loader: Callable[[], Awaitable[ApiResponse]]) -> ApiResponse:
+        cached = self.cache.get(key)
+        if cached is not None:
+            return True, deepcopy(cached)
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # might've been loaded while waiting for the lock
+            cached = self.cache.get(key)
+            if cached is not None:
+                return True, deepcopy(cached)
+            status, data = await loader()
+            if not status:
+                return status, data
+            self.cache.set(key, data)
+            return status, deepcopy(data)
+
+    def invalidate(self, repo: Optional[str] = None, kind: Optional[str] = None) -> int:
+        """ Drops cached metadata of the repo (or every repo), optionally only of given kind """
+        return self.cache.invalidate(
+            lambda key: (repo is None or key[0] == repo) and (kind is None or key[1] == kind)
+        )
+
+    def describe(self) -> str:
+        return f"**Repo metadata**: {self.cache.describe()}"
@@ -0,0 +1,149 @@
+import asyncio
+import json
+from time import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from aiohttp import ClientSession, ClientError, ClientTimeout
+from loguru import logger
+
+from .cache import TTLCache
+
+PLAYER_SUMMARIES_URL = "http://api.steampowered.com/ISteamUser/GetPlayerSummaries/v0002/"
+MAX_BATCH_SIZE = 100  # GetPlayerSummaries limit of steamids per request
+
+
+class SteamProfileResolver:
+    """
+    Resolves Steam profiles (name and avatar), gathering concurrent lookups into single GetPlayerSummaries request.
+    Profiles are cached in memory and in Redis; once cached profile expires, it's still served if Steam doesn't
+    answer in `wait_timeout` seconds.
+    """
+
+    def __init__(self, session: ClientSession, redis, api_key: str, batch_window: float = 0.05,
+                 ttl: float = 6 * 60 * 60, stale_ttl: float = 7 * 24 * 60 * 60, wait_timeout: float = 2):
+        self.session = session
+        self.redis = redis
+        self.api_key = api_key
+        self.batch_window = batch_window
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.wait_timeout = wait_timeout
+
+        self.cache = TTLCache(max_size=4096, ttl=ttl)
+        self.requests_sent = 0
+        self.stale_served = 0
+
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    @staticmethod
+    def _redis_key(steam_id: str) -> str:
+        return f"steam-profile:{steam_id}"
+
+    async def resolve(self, steam_id: Union[str, int]) -> Optional[dict]:
+        steam_id = str(steam_id)
+        profile = self.cache.get(steam_id)
+        if profile is not None:
+            return profile
+
+        stale_profile = self.cache.peek(steam_id)
+        if stale_profile is None:
+            profile, fresh = await self._get_stored(steam_id)
+            if fresh:
+                self.cache.set(steam_id, profile)
+                return profile
+            stale_profile = profile
+
+        future = self._enqueue(steam_id)
+        try:
+            profile = await asyncio.wait_for(asyncio.shield(future), self.wait_timeout)
+        except asyncio.TimeoutError:
+            profile = None
+            logger.warning(f"[Steam] Profile lookup of {steam_id} timed out")
+
+        if profile is None and stale_profile is not None:
+            self.stale_served += 1
+            return stale_profile
+        return profile
+
+    async def _get_stored(self, steam_id: str) -> Tuple[Optional[dict], bool]:
+        try:
+            raw = await self.redis.get(self._redis_key(steam_id), encoding="utf8")
+        except Exception:
+            logger.exception(f"[Steam] Failed reading cached profile of {steam_id}")
+            return None, False
+        if not raw:
+            return None, False
+        stored = json.loads(raw)
+        return stored["profile"], time() - stored["fetched_at"] < self.ttl
+
+    def _enqueue(self, steam_id: str) -> asyncio.Future:
+        future = asyncio.get_event_loop().create_future()
+        self._pending.setdefault(steam_id, []).append(future)
+
+        if len(self._pending) >= MAX_BATCH_SIZE:
+            self._flush()
+        elif not self._flush_handle:
+            self._flush_handle = asyncio.get_event_loop().call_later(self.batch_window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.ensure_future(self._fetch(batch))
+
+    async def _fetch(self, batch: Dict[str, List[asyncio.Future]]):
+        profiles = {}
+        self.requests_sent += 1
+        try:
+            async with self.session.get(
+                PLAYER_SUMMARIES_URL,
+                params={"key": self.api_key, "steamids": ",".join(batch.keys())},
+                timeout=ClientTimeout(total=15),
+            ) as resp:
+                if resp.status == 200:
+                    data = await resp.json()
+                    for player in data["response"]["players"]:
+                        profiles[player["steamid"]] = {
+                            "personaname": player.get("personaname"),
+                            "avatarmedium": player.get("avatarmedium"),
+                        }
+                else:
+                    logger.warning(f"[Steam] GetPlayerSummaries responded with {resp.status}")
+        except (ClientError, asyncio.TimeoutError) as error:
+            logger.warning(f"[Steam] GetPlayerSummaries failed: {error!r}")
+        except (KeyError, TypeError, ValueError) as error:
+            # malformed response, waiting lookups still get whatever was parsed before it
+            logger.warning(f"[Steam] GetPlayerSummaries returned unexpected response: {error!r}")
+
+        for steam_id, futures in batch.items():
+            profile = profiles.get(steam_id, None)
+            if profile is not None:
+                self.cache.set(steam_id, profile)
+            for future in futures:
+                if not future.done():
+                    future.set_result(profile)
+
+        if profiles:
+            await self._store(profiles)
+
+    async def _store(self, profiles: Dict[str, dict]):
+        pipe = self.redis.pipeline()
+        fetched_at = time()
+        for steam_id, profile in profiles.items():
+            pipe.set(
+                self._redis_key(steam_id),
+                json.dumps({"fetched_at": fetched_at, "profile": profile}),
+                expire=int(self.stale_ttl)
+            )
+        try:
+            await pipe.execute()
+        except Exception:
+            logger.exception(f"[Steam] Failed storing {len(profiles)} profiles")
+
+    def describe(self) -> str:
+        return f"**Steam profiles**: {self.cache.describe()}, {self.requests_sent} requests, " \
+               f"{self.stale_served} stale served"
@@ -1,27 +1,252 @@
+import asyncio
+import json
 import os
+from hashlib import sha1
+from typing import List, Optional, NamedTuple, Dict, Tuple
+
 from google.cloud.translate import TranslationServiceAsyncClient
-from typing import List, Optional
+from loguru import logger
+
+from .cache import TTLCache
+from .language_detection import english_confidence
 
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = os.getcwd() + f"/bot/{os.getenv('GOOGLE_PROJECT_CREDS_FILENAME', '')}"
 
 client = TranslationServiceAsyncClient()
 parent = f"projects/{os.getenv('GOOGLE_PROJECT_API', '')}/locations/global"
 
+CACHE_TTL: int = 7 * 24 * 60 * 60
+BATCH_WINDOW: float = float(os.getenv("TRANSLATION_BATCH_WINDOW", 0.005))
+BATCH_MAX_SIZE: int = 128
+# Google recommends keeping single request below 1024 segments and 30k codepoints, staying well under both
+REQUEST_MAX_SEGMENTS: int = 128
+REQUEST_MAX_CODEPOINTS: int = 20000
+REQUEST_CONCURRENCY: int = 4
+LOCAL_DETECTION_THRESHOLD: float = float(os.getenv("LOCAL_DETECTION_THRESHOLD", 0.7))
+
+
+class Translation(NamedTuple):
+    translated_text: str
+    detected_language_code: str
+
+
+class _CacheStats:
+    def __init__(self):
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.language_hits = 0
+        self.misses = 0
+        self.local_detections = 0
+        self.batched_calls = 0
+        self.batches = 0
+
+
+class _TranslationBatcher:
+    """
+    Merges `translate_single` calls arriving within `window` seconds and sharing target language
+    into single `translate` call, resolving every caller with its own result.
+    """
+
+    def __init__(self, window: float, max_size: int):
+        self.window = window
+        self.max_size = max_size
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        self._handles: Dict[str, asyncio.TimerHandle] = {}
+
+    def submit(self, text: str, target_lang: str) -> asyncio.Future:
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(target_lang, [])
+        pending.append((text, future))
+
+        if len(pending) >= self.max_size:
+            self._flush(target_lang)
+        elif target_lang not in self._handles:
+            self._handles[target_lang] = loop.call_later(self.window, self._flush, target_lang)
+        return future
+
+    def _flush(self, target_lang: str):
+        handle = self._handles.pop(target_lang, None)
+        if handle:
+            handle.cancel()
+        batch = self._pending.pop(target_lang, [])
+        if batch:
+            asyncio.ensure_future(self._run(batch, target_lang))
+
+    @staticmethod
+    async def _run(batch: List[Tuple[str, asyncio.Future]], target_lang: str):
+        _stats.batches += 1
+        _stats.batched_calls += len(batch)
+        try:
+            translations = await translate([text for text, _ in batch], target_lang)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), translation in zip(batch, translations):
+            if not future.done():
+                future.set_result(translation)
+
+
+_stats = _CacheStats()
+_batcher = _TranslationBatcher(BATCH_WINDOW, BATCH_MAX_SIZE)
+_request_semaphore: Optional[asyncio.Semaphore] = None
+_translations_cache = TTLCache(max_size=20000)
+_languages_cache = TTLCache(max_size=20000)
+_redis = None
+
+
+def attach_redis(redis):
+    """ Enables shared Redis tier of translation cache """
+    global _redis
+    _redis = redis
+
+
+def _translation_key(text: str, target_lang: str) -> str:
+    return "tl:" + sha1(f"{target_lang}\0{text}".encode("utf8")).hexdigest()
+
+
+def _language_key(text: str) -> str:
+    return "tl-lang:" + sha1(text.encode("utf8")).hexdigest()
+
+
+def _is_target_language(language: str, target_lang: str) -> bool:
+    """ Whether text in `language` needs no translation. Chinese variants are different scripts, so not counted """
+    language, target_lang = language.lower(), target_lang.lower()
+    base = language.split("-")[0]
+    return language == target_lang or (base == target_lang.split("-")[0] and base != "zh")
+
 
 async def translate_single(input_text: str, target_lang: Optional[str] = "en-US"):
-    translations = await translate([input_text, ], target_lang)
-    result = translations[0]
+    result = await _batcher.submit(input_text, target_lang)
     return result.translated_text, result.detected_language_code
 
 
-async def translate(input_strings: List[str], target_lang: Optional[str] = "en-US"):
-    response = await client.translate_text(
-        request={
-            "parent": parent,
-            "contents": input_strings,
-            "mime_type": "text/plain",
-            "target_language_code": target_lang,
-        }
-    )
-    return response.translations
+async def translate(input_strings: List[str], target_lang: Optional[str] = "en-US") -> List[Translation]:
+    results: List[Optional[Translation]] = [None] * len(input_strings)
+    missing: Dict[str, List[int]] = {}
+    english_target = _is_target_language("en", target_lang)
+
+    for i, text in enumerate(input_strings):
+        cached = _translations_cache.get(_translation_key(text, target_lang))
+        if cached is None and english_target and english_confidence(text) >= LOCAL_DETECTION_THRESHOLD:
+            cached = Translation(text, "en")
+            _stats.local_detections += 1
+        elif cached is None:
+            language = _languages_cache.get(_language_key(text))
+            if language is not None and _is_target_language(language, target_lang):
+                cached = Translation(text, language)
+                _stats.language_hits += 1
+        else:
+            _stats.memory_hits += 1
+        if cached is None:
+            missing.setdefault(text, []).append(i)
+        results[i] = cached
+
+    if missing and _redis:
+        await _fill_from_redis(missing, results, target_lang)
+
+    if missing:
+        texts = list(missing.keys())
+        _stats.misses += len(texts)
+        translations = await _translate_remote(texts, target_lang)
+        for text, translation in zip(texts, translations):
+            for i in missing[text]:
+                results[i] = translation
+        await _store(texts, translations, target_lang)
+
+    return results
+
+
+async def _fill_from_redis(missing: Dict[str, List[int]], results: List[Optional[Translation]], target_lang: str):
+    texts = list(missing.keys())
+    keys = [_translation_key(text, target_lang) for text in texts] + [_language_key(text) for text in texts]
+    try:
+        values = await _redis.mget(*keys, encoding="utf8")
+    except Exception:
+        logger.exception("[Translation] Failed reading Redis cache")
+        return
+    translations, languages = values[:len(texts)], values[len(texts):]
+
+    for text, raw_translation, language in zip(texts, translations, languages):
+        translation = None
+        if raw_translation:
+            translation = Translation(*json.loads(raw_translation))
+            _translations_cache.set(_translation_key(text, target_lang), translation)
+        elif language:
+            _languages_cache.set(_language_key(text), language)
+            if _is_target_language(language, target_lang):
+                translation = Translation(text, language)
+        if translation is None:
+            continue
+        _stats.redis_hits += 1
+        for i in missing.pop(text):
+            results[i] = translation
+
+
+def _split_request(input_strings: List[str]) -> List[List[str]]:
+    """ Splits strings into chunks fitting per-request segment and codepoint limits, preserving order """
+    chunks, current, current_length = [], [], 0
+    for text in input_strings:
+        if current and (len(current) >= REQUEST_MAX_SEGMENTS or current_length + len(text) > REQUEST_MAX_CODEPOINTS):
+            chunks.append(current)
+            current, current_length = [], 0
+        current.append(text)
+        current_length += len(text)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def _translate_remote(input_strings: List[str], target_lang: str) -> List[Translation]:
+    global _request_semaphore
+    if _request_semaphore is None:
+        _request_semaphore = asyncio.Semaphore(REQUEST_CONCURRENCY)
+
+    chunks = _split_request(input_strings)
+    if len(chunks) > 1:
+        logger.info(f"[Translation] Split {len(input_strings)} strings into {len(chunks)} requests")
+    translated_chunks = await asyncio.gather(*[_translate_chunk(chunk, target_lang) for chunk in chunks])
+    return [translation for chunk in translated_chunks for translation in chunk]
+
+
+async def _translate_chunk(input_strings: List[str], target_lang: str) -> List[Translation]:
+    async with _request_semaphore:
+        response = await client.translate_text(
+            request={
+                "parent": parent,
+                "contents": input_strings,
+                "mime_type": "text/plain",
+                "target_language_code": target_lang,
+            }
+        )
+    return [
+        Translation(translation.translated_text, translation.detected_language_code)
+        for translation in response.translations
+    ]
+
+
+async def _store(texts: List[str], translations: List[Translation], target_lang: str):
+    for text, translation in zip(texts, translations):
+        _translations_cache.set(_translation_key(text, target_lang), translation)
+        _languages_cache.set(_language_key(text), translation.detected_language_code)
+    if not _redis:
+        return
+    pipe = _redis.pipeline()
+    for text, translation in zip(texts, translations):
+        pipe.set(_translation_key(text, target_lang), json.dumps(translation), expire=CACHE_TTL)
+        pipe.set(_language_key(text), translation.detected_language_code, expire=CACHE_TTL)
+    try:
+        await pipe.execute()
+    except Exception:
+        logger.exception(f"[Translation] Failed storing {len(texts)} translations in Redis")
+
 
+def describe() -> str:
+    total = _stats.memory_hits + _stats.redis_hits + _stats.language_hits + _stats.local_detections + _stats.misses
+    ratio = (total - _stats.misses) / total * 100 if total else 0
+    return f"**Translation cache**: {_stats.memory_hits} memory hits, {_stats.redis_hits} Redis hits, " \
+           f"{_stats.language_hits} same-language hits, {_stats.misses} misses ({ratio:.0f}% hit)\n" \
+           f"{_stats.local_detections} strings detected as english locally, skipping translation API\n" \
+           f"{_stats.batched_calls} single translations merged into {_stats.batches} batches"
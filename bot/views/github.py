@@ -1,4 +1,7 @@
+import asyncio
+from collections import deque
 from datetime import datetime
+from typing import Deque
 
 from discord import Interaction, ButtonStyle, Embed, Colour
 from discord.ui import button, Button
@@ -6,9 +9,13 @@ from loguru import logger
 
 from .generic import TimeoutView, MultiselectView, TimeoutErasingView, MultiselectDropdown, ActionButton
 from .views_subdata import close_reason_selection, reopen_reason_selection
-from ..cogs.embeds import get_issue_embed, parse_markdown
+from ..cogs.cog_util import edit_issue_message
+from ..cogs.embeds import get_issue_embed
 from ..constants import PRESET_REPOSITORIES, Union
+from ..enums import RequestPriority
+from ..github_graphql import get_issue_details
 from ..github_integration import *
+from ..markdown import render_markdown
 
 
 class IssueCreation(TimeoutErasingView):
@@ -48,15 +55,13 @@ class IssueControls(TimeoutView):
         Since any button changes issue data, we should update it after every successful interaction,
         and update issue embed
         """
-        status, data = await get_issue_by_number(self.session, self.repo, self.github_id)
+        status, data = await get_issue_details(self.session, self.repo, self.github_id, RequestPriority.HIGH)
         if status:
             self.details = data
             new_embed = await get_issue_embed(self.session, self.details, self.github_id, self.repo)
 
             if self.assigned_message:
-                self.assigned_message = await self.assigned_message.edit(
-                    content=self.assigned_message.content, embed=new_embed, view=self
-                )
+                self.assigned_message = await edit_issue_message(self.assigned_message, new_embed, view=self)
             else:
                 logger.warning(f"_update_details missing assigned message!")
 
@@ -198,14 +203,26 @@ class IssueControls(TimeoutView):
 
 
 class GithubPaginationControls(TimeoutView):
+    """
+    Pages through comments of issue. Comments are streamed from GitHub and rendered once, page boundaries
+    are fixed as pages are built, and built page embeds are kept for the life of the view,
+    so paging back and forth costs no requests. Next page is built in background while current one is shown.
+    """
+    page_length_limit = 2000
+
     def __init__(self, session: ClientSession, repo: str, github_id: Union[str, int]):
         self.session = session
         self.repo_name = repo
         self.github_id = github_id
-        self.details = None
 
         self.current_page = 0
-        self.pages_dates = [None for _ in range(100)]
+        self.comment_pages = iterate_issue_comment_pages(session, repo, github_id, priority=RequestPriority.NORMAL)
+        self.page_embeds: List[Embed] = []
+        self._pending_comments: Deque[dict] = deque()
+        self._carried_entry: Optional[str] = None
+        self._exhausted = False
+        self._pages_lock = asyncio.Lock()
+        self._prefetch: Optional[asyncio.Future] = None
 
         super().__init__()
 
@@ -222,6 +239,14 @@ class GithubPaginationControls(TimeoutView):
 
     @button(emoji="⏭️", style=ButtonStyle.green)
     async def next_page(self, _button: Button, interaction: Interaction):
+        try:
+            loaded = await self.load_page(self.current_page + 1)
+        except GithubRequestError as error:
+            await interaction.response.send_message(f"Github error occurred:\n{error.details}", ephemeral=True)
+            return
+        if not loaded:
+            await interaction.response.send_message(f"Reached end of the conversation!", ephemeral=True)
+            return
         self.current_page += 1
         status, embed = await self.get_embed(interaction)
         if not status:
@@ -243,55 +268,97 @@ class GithubPaginationControls(TimeoutView):
         return "\n".join(appropriate_lines), override_author
 
     async def get_embed(self, interaction: Interaction):
-        since_date = self.pages_dates[self.current_page]
-        status, self.details = await get_issue_comments(
-            self.session, self.repo_name, self.github_id, since_date
-        )
-        if not status:
-            await interaction.response.send_message(f"Github error occurred:\n{self.details}", ephemeral=True)
+        try:
+            loaded = await self.load_page(self.current_page)
+        except GithubRequestError as error:
+            await interaction.response.send_message(f"Github error occurred:\n{error.details}", ephemeral=True)
             return False, None
-        if len(self.details) <= 0:
+        if not loaded:
             await interaction.response.send_message(f"No comments for that issue/PR exist yet.", ephemeral=True)
             return False, None
-        return True, await self.__generate_embed()
+        self._prefetch_next_page()
+        return True, self.page_embeds[self.current_page]
+
+    async def load_page(self, index: int) -> bool:
+        """ Builds pages up to index, returns False if conversation has less pages than that """
+        async with self._pages_lock:
+            while len(self.page_embeds) <= index and await self.__build_next_page():
+                pass
+        return index < len(self.page_embeds)
+
+    def _prefetch_next_page(self):
+        if len(self.page_embeds) > self.current_page + 1 or (self._prefetch and not self._prefetch.done()):
+            return
+        self._prefetch = asyncio.ensure_future(self.__prefetch(self.current_page + 1))
+
+    async def __prefetch(self, index: int):
+        try:
+            await self.load_page(index)
+        except GithubRequestError:
+            # already logged, page is requested again once user asks for it
+            pass
+
+    async def on_timeout(self) -> None:
+        if self._prefetch and not self._prefetch.done():
+            self._prefetch.cancel()
+        async with self._pages_lock:
+            await self.comment_pages.aclose()
+        await super().on_timeout()
+
+    async def __next_entry(self) -> Optional[str]:
+        if self._carried_entry:
+            entry, self._carried_entry = self._carried_entry, None
+            return entry
+        while not self._pending_comments:
+            if self._exhausted:
+                return None
+            try:
+                self._pending_comments.extend(await self.comment_pages.__anext__())
+            except StopAsyncIteration:
+                self._exhausted = True
+                return None
+            except GithubRequestError as error:
+                # failed generator is finished, continue from the failed page next time
+                self.comment_pages = github_api_iterate_pages(
+                    self.session, error.request_path, priority=RequestPriority.NORMAL
+                )
+                raise
+        return await self.__render_comment(self._pending_comments.popleft())
 
-    async def __generate_embed(self) -> Embed:
-        embed_body = []
-        current_length = 0
+    async def __render_comment(self, comment: dict) -> str:
+        override_author = None
 
-        for comment in self.details:
-            override_author = None
+        new_body = comment["body"] or ""
+        if comment['user']['login'] == "ArcadiaReduxAutomation":
+            new_body, override_author = self.preprocess_comment_body(new_body)
 
-            new_body = comment["body"] or ""
-            if comment['user']['login'] == "ArcadiaReduxAutomation":
-                new_body, override_author = self.preprocess_comment_body(new_body)
+        new_body = (await render_markdown(self.session, new_body, self.repo_name, limit=1000)).text
 
-            if len(new_body) > 500:
-                new_body = new_body[:1000] + " ..."
+        created_at_date = datetime.strptime(comment['created_at'], "%Y-%m-%dT%H:%M:%SZ")
+        comment_timestamp = created_at_date.timestamp()
 
-            new_body = await parse_markdown(self.session, new_body, self.repo_name)
+        if override_author:
+            user_link = f"{override_author} via [**{comment['user']['login']}**]({comment['user']['html_url']})"
+        else:
+            user_link = f"[**{comment['user']['login']}**]({comment['user']['html_url']})"
 
-            created_at_date = datetime.strptime(comment['created_at'], "%Y-%m-%dT%H:%M:%SZ")
-            comment_timestamp = created_at_date.timestamp()
+        return f"**<t:{int(comment_timestamp)}:R>** {user_link}:\n{new_body}\n"
 
-            if override_author:
-                user_link = f"{override_author} via [**{comment['user']['login']}**]({comment['user']['html_url']})"
-            else:
-                user_link = f"[**{comment['user']['login']}**]({comment['user']['html_url']})"
-
-            comment_entry = f"**<t:{int(comment_timestamp)}:R>** " \
-                            f"{user_link}:\n{new_body}\n"
-            comment_entry_len = len(comment_entry)
-            if comment_entry_len + current_length < 2000:
-                current_length += comment_entry_len
-                embed_body.append(
-                    comment_entry
-                )
-            else:
-                self.pages_dates[self.current_page + 1] = comment["created_at"]
+    async def __build_next_page(self) -> bool:
+        embed_body = []
+        current_length = 0
+        while (comment_entry := await self.__next_entry()) is not None:
+            # oversized comment still gets its own page
+            if embed_body and len(comment_entry) + current_length >= self.page_length_limit:
+                self._carried_entry = comment_entry
                 break
+            current_length += len(comment_entry)
+            embed_body.append(comment_entry)
+        if not embed_body:
+            return False
+
         embed = Embed(
-            title=f"Page: {self.current_page + 1}",
+            title=f"Page: {len(self.page_embeds) + 1}",
             description="\n".join(embed_body),
             colour=Colour.dark_gold()
         )
@@ -299,4 +366,93 @@ class GithubPaginationControls(TimeoutView):
             name=f"Comments at #{self.github_id} in {self.repo_name}",
             url=f"https://github.com/arcadia-redux/{self.repo_name}/issues/{self.github_id}"
         )
+        self.page_embeds.append(embed)
+        return True
+
+
+class IssueListPagination(TimeoutView):
+    """
+    Pages through issues of repo. Pages are pulled from streaming iterator only when requested (next one
+    is prefetched meanwhile), already shown pages are kept as rendered text to go back instantly.
+    """
+
+    def __init__(self, session: ClientSession, repo: str, state: str, per_page: int = 15):
+        self.session = session
+        self.repo_name = repo
+        self.state = state
+
+        self.pages = iterate_issue_pages(session, repo, state, per_page, RequestPriority.NORMAL)
+        self.rendered_pages: List[str] = []
+        self.exhausted = False
+        self.current_page = 0
+        self._pages_lock = asyncio.Lock()
+
+        super().__init__()
+
+    async def load_page(self, index: int) -> bool:
+        """
+        Pulls pages up to index from iterator, returns False if there are less pages than that.
+        Raises GithubRequestError if page request failed, it's requested again on next call.
+        """
+        async with self._pages_lock:
+            while len(self.rendered_pages) <= index and not self.exhausted:
+                try:
+                    issues = await self.pages.__anext__()
+                except StopAsyncIteration:
+                    self.exhausted = True
+                    break
+                except GithubRequestError as error:
+                    self.pages = github_api_iterate_pages(
+                        self.session, error.request_path, priority=RequestPriority.NORMAL
+                    )
+                    raise
+                self.rendered_pages.append(format_issue_list(issues))
+        return index < len(self.rendered_pages)
+
+    async def close_pages(self):
+        """ Stops iteration, cancelling prefetch of the next page """
+        async with self._pages_lock:
+            await self.pages.aclose()
+
+    def get_embed(self) -> Embed:
+        embed = Embed(
+            title=f"Page: {self.current_page + 1}",
+            description=self.rendered_pages[self.current_page],
+            colour=Colour.dark_teal()
+        )
+        embed.set_author(
+            name=f"{self.state.capitalize()} issues in {self.repo_name}",
+            url=f"https://github.com/arcadia-redux/{self.repo_name}/issues"
+        )
         return embed
+
+    @button(emoji="⏮️", style=ButtonStyle.green)
+    async def prev_page(self, _button: Button, interaction: Interaction):
+        if self.current_page == 0:
+            await interaction.response.send_message(f"Reached beginning of the list!", ephemeral=True)
+            return
+        self.current_page -= 1
+        await interaction.response.edit_message(embed=self.get_embed())
+
+    @button(emoji="⏭️", style=ButtonStyle.green)
+    async def next_page(self, _button: Button, interaction: Interaction):
+        try:
+            loaded = await self.load_page(self.current_page + 1)
+        except GithubRequestError as error:
+            await interaction.response.send_message(f"Github error occurred:\n{error.details}", ephemeral=True)
+            return
+        if not loaded:
+            await interaction.response.send_message(f"Reached end of the list!", ephemeral=True)
+            return
+        self.current_page += 1
+        await interaction.response.edit_message(embed=self.get_embed())
+
+    @button(emoji="✖️", style=ButtonStyle.danger)
+    async def cancel_view(self, _button: Button, interaction: Interaction):
+        self.stop()
+        await self.close_pages()
+        await self.remove_view_from_message()
+
+    async def on_timeout(self) -> None:
+        await self.close_pages()
+        await super().on_timeout()
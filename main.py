@@ -1 +1,3 @@
-from bot import main
+# bot isn't started in image compression workers, they're spawned with this module as their main one
+if __name__ == "__main__":
+    from bot import main